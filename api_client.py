@@ -1,8 +1,21 @@
 import os
 import json
-from openai import OpenAI
+import time
+import random
+import asyncio
+import threading
+import contextlib
+from email.utils import parsedate_to_datetime
+import soundfile as sf
+import openai
+from openai import AsyncOpenAI
 from PyQt5.QtCore import QThread, pyqtSignal
 
+from audio_processing import EncoderSelector, to_whisper_format, audio_fingerprint
+from settings import get_settings
+from cache import SqliteCache, make_key, normalize_text
+from metrics import API_LATENCY_SECONDS, API_REQUESTS, UPLOAD_BYTES, GPT_FIRST_TOKEN_SECONDS
+
 class ApiKeyManager:
     """Gestiona el almacenamiento y recuperación de la API key de OpenAI"""
     
@@ -30,36 +43,435 @@ class ApiKeyManager:
             print(f"Error al cargar API key: {e}")
             return ""
 
+class ApiError(Exception):
+    """Error de una petición a la API. `retryable` indica si tiene sentido reintentarla"""
+    retryable = False
+    
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ApiRateLimitError(ApiError):
+    """429: se ha superado el límite de peticiones o de tokens por minuto"""
+    retryable = True
+
+
+class ApiQuotaError(ApiError):
+    """429 por cuota agotada: reintentar no sirve de nada"""
+
+
+class ApiAuthError(ApiError):
+    """401/403: API key inválida o sin permisos"""
+
+
+class ApiConnectionError(ApiError):
+    """Timeout o fallo de red"""
+    retryable = True
+
+
+class ApiServerError(ApiError):
+    """5xx: error transitorio del servidor"""
+    retryable = True
+
+
+class ApiRequestError(ApiError):
+    """4xx: la petición es incorrecta (archivo no válido, parámetros...)"""
+
+
+def _retry_after(response):
+    """Segundos indicados por el servidor en Retry-After (o None)"""
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # Formato fecha HTTP
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def to_api_error(error):
+    """Convierte una excepción del SDK de OpenAI en un ApiError tipado"""
+    if isinstance(error, ApiError):
+        return error
+    message = str(error)
+    status = getattr(error, "status_code", None)
+    retry_after = _retry_after(getattr(error, "response", None))
+    
+    if isinstance(error, openai.RateLimitError) or status == 429:
+        if getattr(error, "code", None) == "insufficient_quota":
+            return ApiQuotaError(message, status)
+        return ApiRateLimitError(message, status, retry_after)
+    if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+        return ApiAuthError(message, status)
+    if isinstance(error, openai.APIConnectionError):
+        return ApiConnectionError(message)
+    if status is not None and (status >= 500 or status in (408, 409)):
+        return ApiServerError(message, status, retry_after)
+    if status is not None:
+        return ApiRequestError(message, status)
+    return ApiError(message)
+
+
+class TokenBucket:
+    """
+    Cubo de tokens para repartir un límite por minuto (peticiones o tokens).
+    
+    Se rellena a `rate_per_minute / 60` unidades por segundo y admite ráfagas
+    de hasta una fracción `burst` del límite. Las esperas se sirven en orden
+    de llegada.
+    Debe usarse siempre desde el mismo event loop.
+    """
+    
+    def __init__(self, rate_per_minute, burst=0.25):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, rate_per_minute * burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+    
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, amount=1):
+        """Espera hasta poder gastar `amount` unidades. Devuelve los segundos esperados"""
+        # Una petición mayor que el cubo se limita a su capacidad para no bloquearse
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self.blocked_until - now
+                if delay <= 0:
+                    if self.tokens >= amount:
+                        self.tokens -= amount
+                        return waited
+                    delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+    
+    def pause(self, seconds):
+        """Bloquea el cubo durante `seconds` segundos (tras un 429) y lo vacía"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class RequestScheduler:
+    """
+    Planificador de peticiones con límites por modelo.
+    
+    Cada modelo tiene un cubo de peticiones por minuto (RPM) y, para los
+    modelos de chat, otro de tokens por minuto (TPM). Los límites se aplican
+    con un margen (`safety`) para quedarse justo por debajo de los de la
+    cuenta. Los errores transitorios se reintentan respetando `Retry-After`
+    o, si no viene, con espera exponencial con jitter; un 429 además pausa
+    los cubos del modelo para que el resto de peticiones no insistan.
+    """
+    
+    # Límites de la cuenta por modelo; "default" se usa para los modelos de chat
+    DEFAULT_LIMITS = {
+        "whisper-1": {"rpm": 50},
+        "default": {"rpm": 500, "tpm": 60000},
+    }
+    
+    def __init__(self, limits=None, safety=0.9, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.limits = dict(self.DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.safety = safety
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {}
+        # Estadísticas
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttled_seconds = 0.0
+    
+    def set_limits(self, limits):
+        """Actualiza los límites; los cubos se recrean solo si han cambiado"""
+        merged = dict(self.DEFAULT_LIMITS)
+        merged.update(limits)
+        if merged != self.limits:
+            self.limits = merged
+            self.buckets = {}
+    
+    def _buckets(self, model):
+        if model not in self.buckets:
+            limits = self.limits.get(model, self.limits["default"])
+            rpm = TokenBucket(limits["rpm"] * self.safety)
+            tpm = TokenBucket(limits["tpm"] * self.safety) if limits.get("tpm") else None
+            self.buckets[model] = (rpm, tpm)
+        return self.buckets[model]
+    
+    def backoff(self, attempt):
+        """Espera exponencial con jitter: entre la mitad y el total de base * 2^intento"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    async def execute(self, model, request, tokens=0):
+        """
+        Ejecuta `request()` (una función que devuelve una corrutina nueva en cada
+        llamada) respetando los límites de `model`. `tokens` es la estimación de
+        tokens de la petición. Lanza un ApiError tipado si no se puede completar.
+        """
+        requests_bucket, tokens_bucket = self._buckets(model)
+        attempt = 0
+        while True:
+            self.throttled_seconds += await requests_bucket.acquire(1)
+            if tokens_bucket is not None and tokens:
+                self.throttled_seconds += await tokens_bucket.acquire(tokens)
+            start = time.perf_counter()
+            try:
+                result = await request()
+                API_LATENCY_SECONDS.observe(time.perf_counter() - start, model=model)
+                API_REQUESTS.inc(model=model, outcome="ok")
+                return result
+            except Exception as e:
+                error = to_api_error(e)
+                API_REQUESTS.inc(model=model, outcome=type(error).__name__)
+                if not error.retryable or attempt >= self.max_retries:
+                    raise error from e
+                
+                delay = self.backoff(attempt)
+                if error.retry_after is not None:
+                    delay = min(self.max_delay, error.retry_after)
+                if isinstance(error, ApiRateLimitError):
+                    self.rate_limited += 1
+                    requests_bucket.pause(delay)
+                    if tokens_bucket is not None:
+                        tokens_bucket.pause(delay)
+                self.retries += 1
+                attempt += 1
+                print(f"Reintentando petición a {model} en {delay:.1f}s ({error})")
+                await asyncio.sleep(delay)
+    
+    def summary(self):
+        return (f"{self.retries} reintentos, {self.rate_limited} respuestas 429, "
+                f"{self.throttled_seconds:.1f}s de espera por límites")
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Estimación rápida (~4 caracteres por token) de los tokens que consume una petición de chat"""
+    prompt = sum(len(message.get("content") or "") for message in messages) // 4
+    return prompt + len(messages) * 4 + (max_tokens or 0)
+
+
+class RequestGroup:
+    """
+    Peticiones al motor lanzadas desde los hilos en los que el grupo está
+    activo (`with grupo.active():`), para poder cancelarlas juntas. Cancelar
+    interrumpe también las que esperan un reintento o un hueco en los
+    límites; las que se lancen después se cancelan al instante.
+    """
+    
+    _local = threading.local()
+    
+    def __init__(self):
+        self.futures = set()
+        self.lock = threading.Lock()
+        self.cancelled = False
+    
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, "group", None)
+    
+    @contextlib.contextmanager
+    def active(self):
+        previous = RequestGroup.current()
+        RequestGroup._local.group = self
+        try:
+            yield self
+        finally:
+            RequestGroup._local.group = previous
+    
+    def add(self, future):
+        with self.lock:
+            if not self.cancelled:
+                self.futures.add(future)
+                future.add_done_callback(self._discard)
+                return
+        future.cancel()
+    
+    def _discard(self, future):
+        with self.lock:
+            self.futures.discard(future)
+    
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+
+
+class ApiEngine:
+    """
+    Motor de peticiones a OpenAI compartido por toda la aplicación.
+    
+    Mantiene un único event loop de asyncio en un hilo dedicado y un único
+    cliente AsyncOpenAI, de modo que todas las transcripciones y consultas
+    reutilizan el mismo pool de conexiones keep-alive en lugar de abrir una
+    conexión TLS nueva por petición.
+    
+    - Desde código asyncio: `await engine.transcribe(...)` / `await engine.chat(...)`
+    - Desde hilos normales: `engine.run(coro)` (bloqueante) o `engine.submit(coro)`
+    - Para poder cancelar un conjunto de peticiones: `with RequestGroup().active(): ...`
+    """
+    
+    _instance = None
+    _instance_lock = threading.Lock()
+    
+    @classmethod
+    def instance(cls, api_key):
+        """Devuelve el motor compartido, actualizando la API key si ha cambiado"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            settings = get_settings().model
+            cls._instance.set_api_key(api_key, settings.api_base_url or None)
+            cls._instance.scheduler.set_limits(settings.rate_limits())
+            return cls._instance
+    
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="ApiEngine", daemon=True)
+        self.thread.start()
+        self.api_key = None
+        self.base_url = None
+        self.client = None
+        # Los reintentos los gestiona el planificador, no el SDK
+        self.scheduler = RequestScheduler()
+    
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+    
+    def set_api_key(self, api_key, base_url=None):
+        """Crea un cliente nuevo solo si cambian la API key o la URL de la API"""
+        if api_key == self.api_key and base_url == self.base_url and self.client is not None:
+            return
+        previous = self.client
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        if previous is not None:
+            self.submit(previous.close())
+    
+    def submit(self, coroutine):
+        """
+        Programa una corrutina en el loop del motor y devuelve un
+        concurrent.futures.Future; si hay un RequestGroup activo en el hilo
+        se registra en él
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        group = RequestGroup.current()
+        if group is not None:
+            group.add(future)
+        return future
+    
+    def run(self, coroutine, timeout=None):
+        """Ejecuta una corrutina en el loop del motor y espera el resultado"""
+        return self.submit(coroutine).result(timeout)
+    
+    async def transcribe(self, audio_file, language=None, prompt=None, model="whisper-1", on_upload=None):
+        """
+        Transcribe un archivo abierto (en disco o BytesIO) con Whisper.
+        `on_upload(segundos)` recibe la duración del intento que tuvo éxito,
+        sin las esperas del planificador ni los reintentos fallidos.
+        """
+        params = {
+            "model": model,
+            "file": audio_file
+        }
+        if language and language != "":
+            params["language"] = language
+        if prompt:
+            params["prompt"] = prompt
+        
+        async def request():
+            # En cada reintento el archivo se vuelve a leer desde el principio
+            audio_file.seek(0)
+            start = time.perf_counter()
+            result = await self.client.audio.transcriptions.create(**params)
+            if on_upload is not None:
+                on_upload(time.perf_counter() - start)
+            return result
+        
+        transcript = await self.scheduler.execute(model, request)
+        return transcript.text
+    
+    async def chat(self, messages, **params):
+        """Envía una conversación al modelo de chat y devuelve el texto de la respuesta"""
+        async def request():
+            return await self.client.chat.completions.create(messages=messages, **params)
+        
+        response = await self.scheduler.execute(
+            params.get("model"), request, estimate_tokens(messages, params.get("max_tokens"))
+        )
+        return response.choices[0].message.content
+    
+    async def chat_stream(self, messages, on_delta, **params):
+        """
+        Como `chat`, pero con `stream=True`: llama a `on_delta(texto)` con cada
+        fragmento según llega y devuelve el texto completo al terminar.
+        Los reintentos solo se aplican hasta abrir el stream.
+        """
+        async def request():
+            return await self.client.chat.completions.create(messages=messages, stream=True, **params)
+        
+        stream = await self.scheduler.execute(
+            params.get("model"), request, estimate_tokens(messages, params.get("max_tokens"))
+        )
+        parts = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+        except Exception as e:
+            raise to_api_error(e) from e
+        return "".join(parts)
+
+
 class TranscriptionThread(QThread):
-    """Hilo para transcribir audio con OpenAI Whisper"""
+    """Hilo para transcribir un archivo de audio sin bloquear la interfaz"""
     transcription_complete = pyqtSignal(bool, str)
     
-    def __init__(self, api_key, filename, language=None):
+    def __init__(self, api_key, filename, language=None, backend=None):
         super().__init__()
         self.api_key = api_key
         self.filename = filename
         self.language = language
+        # Motor de transcripción (TranscriptionBackend); por defecto la API de OpenAI
+        self.backend = backend
     
     def run(self):
         try:
-            # Inicializar cliente con nueva API
-            client = OpenAI(api_key=self.api_key)
+            # Consulta la caché y, si no está, transcribe con el motor elegido
+            if self.backend is not None:
+                text = self.backend.transcribe_file(self.filename, self.language)
+            else:
+                text = WhisperService.transcribe_file(self.api_key, self.filename, self.language)
             
-            # Abrir el archivo de audio
-            with open(self.filename, "rb") as audio_file:
-                # Preparar parámetros para la transcripción
-                params = {
-                    "model": "whisper-1",
-                    "file": audio_file
-                }
-                if self.language and self.language != "":
-                    params["language"] = self.language
-                
-                # Llamar a la API de OpenAI para transcribir con la nueva interfaz
-                transcript = client.audio.transcriptions.create(**params)
-                
-                # Emitir el resultado
-                self.transcription_complete.emit(True, transcript.text)
+            # Emitir el resultado
+            self.transcription_complete.emit(True, text)
         except Exception as e:
             self.transcription_complete.emit(False, str(e))
 
@@ -67,6 +479,12 @@ class TranscriptionThread(QThread):
 class WhisperService:
     """Servicio para transcribir audio usando OpenAI Whisper"""
     
+    # Selección de codificación compartida por todas las subidas
+    encoder_selector = EncoderSelector()
+    encoder_settings = None
+    # Caché persistente de transcripciones (se crea al primer uso)
+    transcription_cache = None
+    
     @staticmethod
     def get_available_languages():
         """Devuelve un diccionario de idiomas disponibles para Whisper"""
@@ -90,97 +508,235 @@ class WhisperService:
         """
         Transcribe un archivo de audio de forma sincrónica.
         Útil para scripts de línea de comandos.
+        Si el mismo audio ya se transcribió con el mismo idioma y modelo, se
+        devuelve el resultado guardado sin subir nada.
+        Lanza ApiError si la transcripción falla.
         """
         try:
-            # Inicializar cliente con nueva API
-            client = OpenAI(api_key=api_key)
-            
+            audio, samplerate = sf.read(file_path, dtype='float32')
+        except Exception:
+            # Formato que soundfile no decodifica: se sube el archivo original, sin caché
             with open(file_path, "rb") as audio_file:
-                params = {
-                    "model": "whisper-1",
-                    "file": audio_file
-                }
-                if language and language != "":
-                    params["language"] = language
-                
-                # Llamar a la API con la nueva interfaz
-                transcript = client.audio.transcriptions.create(**params)
-                return transcript.text
-        except Exception as e:
-            return f"[Error: {str(e)}]"
+                return WhisperService._transcribe(api_key, audio_file, language)
+        return WhisperService.transcribe_buffer(api_key, audio, samplerate, language, use_cache=True)
+    
+    @staticmethod
+    def transcribe_buffer(api_key, audio, samplerate, language=None, prompt=None, use_cache=False):
+        """
+        Transcribe un buffer de audio en memoria sin pasar por disco.
+        El audio se codifica una sola vez y se sube directamente.
+        `prompt` permite dar continuidad con el texto ya transcrito.
+        Con `use_cache` se consulta antes la caché de transcripciones.
+        Lanza ApiError si la transcripción falla.
+        """
+        cache = WhisperService.get_transcription_cache() if use_cache else None
+        if cache is not None:
+            key = WhisperService.transcription_key(
+                audio, samplerate, language, get_settings().model.whisper_model, prompt
+            )
+            text = cache.get(key)
+            if text is not None:
+                return text
+        
+        audio_file = WhisperService.prepare_upload(audio, samplerate)
+        text = WhisperService._transcribe(api_key, audio_file, language, prompt)
+        
+        if cache is not None:
+            cache.put(key, text)
+        return text
+    
+    @staticmethod
+    def transcription_key(audio, samplerate, language, model, prompt=None):
+        """Clave de la caché de transcripciones: huella del audio, idioma, modelo y prompt"""
+        return make_key(audio_fingerprint(audio, samplerate), language or "", model, prompt or "")
+    
+    @staticmethod
+    def get_transcription_cache():
+        """Caché de transcripciones con los límites de la configuración actual, o None si está desactivada"""
+        settings = get_settings().cache
+        if not settings.transcription_enabled:
+            return None
+        if WhisperService.transcription_cache is None:
+            WhisperService.transcription_cache = SqliteCache("transcriptions")
+        WhisperService.transcription_cache.max_entries = settings.transcription_max_entries
+        WhisperService.transcription_cache.max_age = settings.transcription_max_age_days * 86400
+        return WhisperService.transcription_cache
+    
+    @staticmethod
+    def prepare_upload(audio, samplerate):
+        """
+        Convierte el audio a 16 kHz mono (formato interno de Whisper) y lo
+        codifica con el formato (WAV, FLAC u Ogg/Opus) que menos tarde en subir
+        """
+        audio, samplerate = to_whisper_format(audio, samplerate)
+        return WhisperService.get_encoder_selector().encode(audio, samplerate)
+    
+    @staticmethod
+    def get_encoder_selector():
+        """Selector de codificación, recreado si cambia la configuración de codificación"""
+        encoding = get_settings().encoding
+        if encoding != WhisperService.encoder_settings:
+            WhisperService.encoder_selector = EncoderSelector(
+                encoding.mode, encoding.opus_bitrate, encoding.upload_bytes_per_second
+            )
+            WhisperService.encoder_settings = encoding
+        return WhisperService.encoder_selector
+    
+    @staticmethod
+    def _transcribe(api_key, audio_file, language=None, prompt=None):
+        """Envía un archivo abierto (en disco o BytesIO) a la API de Whisper"""
+        engine = ApiEngine.instance(api_key)
+        
+        on_upload = None
+        if hasattr(audio_file, "getbuffer"):
+            size = len(audio_file.getbuffer())
+            # Medir solo la petición que tuvo éxito para ajustar la elección de codificación
+            selector = WhisperService.encoder_selector
+            on_upload = lambda seconds: selector.report_upload(size, seconds)
+        else:
+            size = os.fstat(audio_file.fileno()).st_size
+        
+        # La petición se hace en el loop compartido (conexión reutilizada)
+        text = engine.run(engine.transcribe(
+            audio_file, language, prompt, get_settings().model.whisper_model, on_upload
+        ))
+        UPLOAD_BYTES.inc(size)
+        return text
 
 class GptClient:
     """Cliente para comunicarse con la API de GPT"""
     
+    # Caché persistente de respuestas (se crea al primer uso)
+    response_cache = None
+    
     @staticmethod
     def load_config():
-        """Carga la configuración del modelo GPT desde el archivo JSON"""
-        config_path = os.path.join(os.path.dirname(__file__), "gpt_config.json")
-        
-        if not os.path.exists(config_path):
-            # Si no existe el archivo, crear uno con configuración predeterminada
-            default_config = {
-                "model": "gpt-3.5-turbo",
-                "system_prompt": "Eres un asistente virtual experto que ayuda a los usuarios a comprender y procesar información. Tu tarea es analizar el texto proporcionado (que viene de una transcripción de audio) y ofrecer respuestas claras, útiles y bien estructuradas. Trata de buscar preguntas en la transcripción, y da de la manera más concisa posible la respuesta a esas preguntas. El texto puede incluir carácteres de otros idiomas por fallo de la transcripción, pero ignora texto que no esté en inglés o español.",
-                "temperature": 0.6,
-                "max_tokens": 1000,
-                "top_p": 1,
-                "frequency_penalty": 0,
-                "presence_penalty": 0
-            }
-            
-            with open(config_path, "w", encoding="utf-8") as f:
-                json.dump(default_config, f, indent=2)
-            
-            return default_config
-        
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error al cargar la configuración GPT: {e}")
+        """Configuración del modelo GPT (en memoria; se recarga si cambia gpt_config.json)"""
+        return get_settings().model.as_dict()
+    
+    @staticmethod
+    def build_messages(transcription, config, summary=None):
+        """Mensajes de sistema y usuario para una transcripción (y el resumen de lo anterior)"""
+        # Formatear la transcripción para que comience con "Transcription: "
+        formatted_transcription = f"Transcription: {transcription}"
+        if summary:
+            formatted_transcription = f"Summary of the earlier conversation: {summary}\n\n{formatted_transcription}"
+        return [
+            {"role": "system", "content": config.system_prompt},
+            {"role": "user", "content": formatted_transcription}
+        ]
+    
+    @staticmethod
+    def get_response_cache():
+        """
+        Caché de respuestas con los límites de la configuración actual, o None
+        si está desactivada o la temperatura hace que las respuestas varíen
+        """
+        settings = get_settings()
+        if not settings.cache.gpt_enabled or settings.model.temperature > settings.cache.gpt_max_temperature:
             return None
+        if GptClient.response_cache is None:
+            GptClient.response_cache = SqliteCache("gpt_responses")
+        GptClient.response_cache.max_entries = settings.cache.gpt_max_entries
+        GptClient.response_cache.max_age = settings.cache.gpt_max_age_days * 86400
+        return GptClient.response_cache
+    
+    @staticmethod
+    def cache_key(transcription, config, summary=None):
+        """Clave de caché: modelo, prompt de sistema, parámetros de muestreo y texto normalizado"""
+        return make_key(
+            config.system_prompt, config.chat_params(),
+            normalize_text(summary or ""), normalize_text(transcription)
+        )
     
     @staticmethod
-    def send_to_gpt(api_key, transcription):
-        """Envía la transcripción a GPT y devuelve la respuesta"""
+    def send_to_gpt(api_key, transcription, on_delta=None, summary=None):
+        """
+        Envía la transcripción a GPT y devuelve la respuesta.
+        Si se indica `on_delta`, la respuesta se recibe en streaming y
+        `on_delta` se llama con cada fragmento de texto según llega.
+        `summary` es el resumen de la parte de la sesión que ya no se envía literal.
+        """
+        success, result, _ = GptClient.query(api_key, transcription, on_delta, summary)
+        return success, result
+    
+    @staticmethod
+    def query(api_key, transcription, on_delta=None, summary=None):
+        """Como `send_to_gpt`, pero devuelve además si la respuesta vino de la caché"""
         try:
-            config = GptClient.load_config()
-            if not config:
-                return False, "Error al cargar la configuración de GPT"
+            config = get_settings().model
             
-            client = OpenAI(api_key=api_key)
+            # Una transcripción ya consultada con la misma configuración se responde al instante
+            cache = GptClient.get_response_cache()
+            key = GptClient.cache_key(transcription, config, summary)
+            if cache is not None:
+                content = cache.get(key)
+                if content is not None:
+                    if on_delta is not None:
+                        on_delta(content)
+                    return True, content, True
             
-            # Formatear la transcripción para que comience con "Transcription: "
-            formatted_transcription = f"Transcription: {transcription}"
+            engine = ApiEngine.instance(api_key)
+            messages = GptClient.build_messages(transcription, config, summary)
             
-            response = client.chat.completions.create(
-                model=config.get("model", "gpt-3.5-turbo"),
-                messages=[
-                    {"role": "system", "content": config.get("system_prompt", "Eres un asistente útil.")},
-                    {"role": "user", "content": formatted_transcription}
-                ],
-                temperature=config.get("temperature", 0.6),
-                max_tokens=config.get("max_tokens", 1000),
-                top_p=config.get("top_p", 1),
-                frequency_penalty=config.get("frequency_penalty", 0),
-                presence_penalty=config.get("presence_penalty", 0)
-            )
+            if on_delta is None:
+                content = engine.run(engine.chat(messages, **config.chat_params()))
+            else:
+                content = engine.run(engine.chat_stream(messages, on_delta, **config.chat_params()))
             
-            return True, response.choices[0].message.content
+            if cache is not None and content:
+                cache.put(key, content)
+            return True, content, False
         except Exception as e:
-            return False, f"Error al comunicarse con GPT: {str(e)}"
+            return False, f"Error al comunicarse con GPT: {str(e)}", False
+    
+    @staticmethod
+    def summarize(api_key, previous_summary, text):
+        """
+        Pide en segundo plano un resumen que incorpore `text` a `previous_summary`.
+        Devuelve un concurrent.futures.Future con el texto del resumen.
+        """
+        settings = get_settings()
+        content = f"Resumen previo: {previous_summary}\n\nTranscripción nueva: {text}" if previous_summary else text
+        engine = ApiEngine.instance(api_key)
+        return engine.submit(engine.chat(
+            [
+                {"role": "system", "content": settings.context.summary_prompt},
+                {"role": "user", "content": content}
+            ],
+            model=settings.model.model,
+            temperature=0.2,
+            max_tokens=settings.context.summary_max_tokens
+        ))
 
 
 class GptQueryThread(QThread):
-    """Hilo para enviar consultas a GPT sin bloquear la interfaz"""
+    """Hilo para enviar consultas a GPT sin bloquear la interfaz (adaptador sobre ApiEngine)"""
     query_complete = pyqtSignal(bool, str)
+    delta_received = pyqtSignal(str)  # fragmento de la respuesta (solo en streaming)
     
-    def __init__(self, api_key, transcription):
+    def __init__(self, api_key, transcription, stream=False, summary=None):
         super().__init__()
         self.api_key = api_key
         self.transcription = transcription
+        self.summary = summary
+        self.stream = stream
+        # Segundos hasta el primer fragmento de la respuesta
+        self.first_token_latency = None
+        self.from_cache = False
     
     def run(self):
-        success, result = GptClient.send_to_gpt(self.api_key, self.transcription)
+        start = time.perf_counter()
+        on_delta = None
+        if self.stream:
+            def on_delta(delta):
+                if self.first_token_latency is None:
+                    self.first_token_latency = time.perf_counter() - start
+                # Se emite desde el hilo del motor; Qt la encola al hilo de la interfaz
+                self.delta_received.emit(delta)
+        success, result, self.from_cache = GptClient.query(
+            self.api_key, self.transcription, on_delta, self.summary
+        )
+        if self.first_token_latency is not None and not self.from_cache:
+            GPT_FIRST_TOKEN_SECONDS.observe(self.first_token_latency)
         self.query_complete.emit(success, result)
@@ -0,0 +1,146 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Buffer circular preasignado para audio multicanal.
+
+    Pensado para un único productor (el hilo de captura) y un único consumidor
+    (el hilo que construye los fragmentos). Cada contador solo lo modifica un
+    hilo, por lo que no hace falta ningún lock: el productor avanza
+    `write_pos` después de copiar los datos y el consumidor avanza `read_pos`
+    después de usarlos.
+
+    Los datos se escriben dos veces (en `i` y en `i + capacity`), de modo que
+    cualquier ventana de hasta `capacity` frames es contigua en memoria y se
+    puede entregar como vista de numpy sin copiar.
+    """
+
+    def __init__(self, capacity, channels, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self._data = np.zeros((2 * self.capacity, channels), dtype=dtype)
+        # Contadores absolutos (nunca se reinician); la posición real es % capacity
+        self.write_pos = 0
+        self.read_pos = 0
+        self.dropped_frames = 0
+
+    def available(self):
+        """Frames escritos que el consumidor aún no ha leído"""
+        return min(self.write_pos - self.read_pos, self.capacity)
+
+    def free_space(self):
+        """Frames que se pueden escribir sin pisar datos no leídos"""
+        return self.capacity - self.available()
+
+    def _skip_overrun(self):
+        """Si el productor ha dado la vuelta, salta los frames ya sobrescritos"""
+        overrun = self.write_pos - self.read_pos - self.capacity
+        if overrun > 0:
+            self.dropped_frames += overrun
+            self.read_pos += overrun
+
+    def write(self, data):
+        """
+        Copia `data` (frames x canales) al buffer.
+        Si el consumidor se queda atrás, los frames más antiguos no leídos se
+        sobrescriben; el consumidor los contabiliza en `dropped_frames`.
+        Devuelve el número de frames escritos.
+        """
+        frames = len(data)
+        if frames == 0:
+            return 0
+        if frames > self.capacity:
+            # Solo tiene sentido conservar el final
+            skipped = frames - self.capacity
+            data = data[-self.capacity:]
+            frames = self.capacity
+            self.write_pos += skipped
+
+        start = self.write_pos % self.capacity
+        end = start + frames
+        self._data[start:end] = data
+        # Copia espejo para que las lecturas siempre sean contiguas
+        if end <= self.capacity:
+            self._data[start + self.capacity:end + self.capacity] = data
+        else:
+            split = self.capacity - start
+            self._data[start + self.capacity:] = data[:split]
+            self._data[:end - self.capacity] = data[split:]
+
+        self.write_pos += frames
+        return frames
+
+    def view(self, start, frames):
+        """Vista sin copia de `frames` frames a partir del contador absoluto `start`"""
+        offset = start % self.capacity
+        return self._data[offset:offset + frames]
+
+    def peek(self, frames=None):
+        """Vista de los próximos frames pendientes sin consumirlos"""
+        self._skip_overrun()
+        available = self.available()
+        if frames is None or frames > available:
+            frames = available
+        return self.view(self.read_pos, frames)
+
+    def consume(self, frames):
+        """Marca `frames` frames como leídos (nunca retrocede)"""
+        if frames < 0:
+            raise ValueError(f"No se pueden consumir {frames} frames")
+        self._skip_overrun()
+        self.read_pos += min(frames, self.available())
+
+    def read(self, frames=None):
+        """
+        Devuelve una vista de los frames pendientes y los marca como leídos.
+        La vista es válida hasta que el productor vuelva a escribir encima,
+        así que hay que copiarla si se va a conservar más allá de `capacity`
+        frames de captura.
+        """
+        chunk = self.peek(frames)
+        self.read_pos += len(chunk)
+        return chunk
+
+    def latest(self, frames):
+        """Vista de los últimos `frames` frames escritos (hayan sido leídos o no)"""
+        frames = min(frames, self.write_pos, self.capacity)
+        return self.view(self.write_pos - frames, frames)
+
+    def clear(self):
+        """Descarta todos los datos pendientes"""
+        self.read_pos = self.write_pos
+
+    def copy_out(self, frames=None):
+        """Lee los frames pendientes y devuelve una copia independiente del buffer"""
+        return np.array(self.read(frames))
+
+
+class LinearBuffer(RingBuffer):
+    """
+    Buffer preasignado de capacidad fija que nunca da la vuelta, para
+    grabaciones de duración conocida.
+
+    Tiene la misma interfaz que RingBuffer, pero reserva `capacity` frames
+    una sola vez y copia cada bloque una sola vez: sin copia espejo la
+    memoria es la de la grabación, no el doble. Lo que no cabe se descarta.
+    """
+
+    def __init__(self, capacity, channels, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self._data = np.zeros((self.capacity, channels), dtype=dtype)
+        self.write_pos = 0
+        self.read_pos = 0
+        self.dropped_frames = 0
+
+    def write(self, data):
+        frames = min(len(data), self.capacity - self.write_pos)
+        if frames <= 0:
+            return 0
+        self._data[self.write_pos:self.write_pos + frames] = data[:frames]
+        self.write_pos += frames
+        return frames
+
+    def view(self, start, frames):
+        return self._data[start:start + frames]
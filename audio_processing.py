@@ -0,0 +1,470 @@
+import io
+import hashlib
+import itertools
+import threading
+import time
+from math import gcd
+
+import numpy as np
+import soundfile as sf
+
+from metrics import ENCODE_SECONDS
+
+try:
+    from scipy.signal import resample_poly as scipy_resample_poly
+    scipy_available = True
+except ImportError:
+    scipy_available = False
+
+
+# Whisper trabaja internamente a 16 kHz mono: subir más resolución solo aumenta el payload
+WHISPER_SAMPLERATE = 16000
+
+# Opus en Ogg depende de la versión de libsndfile
+opus_available = 'OPUS' in sf.available_subtypes('OGG')
+
+_chunk_ids = itertools.count(1)
+
+
+class AudioChunk:
+    """Fragmento de audio en memoria que viaja del grabador al transcriptor"""
+
+    def __init__(self, audio, samplerate, start_frame=0, end_frame=None):
+        self.chunk_id = next(_chunk_ids)
+        self.audio = audio
+        self.samplerate = samplerate
+        # Posición del primer y último frame dentro de la sesión de captura.
+        # Un fragmento fusionado puede cubrir más tiempo que el audio que contiene.
+        self.start_frame = start_frame
+        self.end_frame = start_frame + len(audio) if end_frame is None else end_frame
+        # Momento en que el fragmento quedó listo, para medir el retraso
+        self.created_at = time.monotonic()
+
+    @property
+    def duration(self):
+        return len(self.audio) / self.samplerate
+
+
+class AudioEncoder:
+    """Codificador de audio en memoria para subir a la API"""
+    name = "wav"
+    format = "WAV"
+    subtype = "PCM_16"
+    extension = "wav"
+    # Estimaciones iniciales hasta tener mediciones reales
+    prior_bytes_per_second = 2 * WHISPER_SAMPLERATE
+    prior_header_bytes = 44          # cabecera del contenedor
+    prior_encode_ratio = 0.001       # segundos de CPU por segundo de audio
+    prior_setup_seconds = 0.0001     # coste fijo de abrir el codificador
+
+    def encode(self, audio, samplerate):
+        buffer = io.BytesIO()
+        sf.write(buffer, audio, samplerate, format=self.format, subtype=self.subtype,
+                 **self.write_options())
+        buffer.seek(0)
+        buffer.name = f"chunk.{self.extension}"
+        return buffer
+
+    def write_options(self):
+        return {}
+
+
+class WavEncoder(AudioEncoder):
+    """PCM de 16 bits sin compresión: coste de CPU casi nulo"""
+
+
+class FlacEncoder(AudioEncoder):
+    """FLAC sin pérdidas: ~40-50% menos bytes que WAV en voz"""
+    name = "flac"
+    format = "FLAC"
+    extension = "flac"
+    prior_bytes_per_second = WHISPER_SAMPLERATE * 2 * 0.6
+    prior_header_bytes = 100
+    prior_encode_ratio = 0.01
+    prior_setup_seconds = 0.0002
+
+
+class OpusEncoder(AudioEncoder):
+    """Opus en contenedor Ogg con pérdidas, pensado para voz a bitrate bajo"""
+    name = "opus"
+    format = "OGG"
+    subtype = "OPUS"
+    extension = "ogg"
+    # Páginas de cabecera de Ogg Opus (OpusHead + OpusTags)
+    prior_header_bytes = 900
+    prior_encode_ratio = 0.03
+    prior_setup_seconds = 0.002
+
+    def __init__(self, bitrate=24000):
+        self.bitrate = bitrate
+        self.prior_bytes_per_second = bitrate / 8
+
+    def write_options(self):
+        # libsndfile traduce compression_level linealmente a bitrate:
+        # 0.0 ~ 256 kbps y 1.0 ~ 6 kbps
+        level = 1.0 - (self.bitrate - 6000) / 250000
+        return {"compression_level": min(1.0, max(0.0, level))}
+
+
+class LinearEstimate:
+    """
+    Ajuste y = intercept + slope * x por mínimos cuadrados con olvido
+    exponencial, partiendo de una estimación a priori.
+
+    Si todas las mediciones tienen casi el mismo x (p. ej. fragmentos de
+    duración fija) la pendiente y el término fijo no se pueden separar: se
+    conserva el término fijo a priori y se ajusta solo la pendiente.
+    """
+
+    def __init__(self, intercept, slope, decay=0.95, min_samples=3):
+        self.intercept = intercept
+        self.slope = slope
+        self.decay = decay
+        self.min_samples = min_samples
+        self.prior_intercept = intercept
+        self.samples = 0
+        self._sums = [0.0, 0.0, 0.0, 0.0, 0.0]  # n, sx, sy, sxx, sxy
+
+    def add(self, x, y):
+        sums = [self.decay * value for value in self._sums]
+        sums[0] += 1
+        sums[1] += x
+        sums[2] += y
+        sums[3] += x * x
+        sums[4] += x * y
+        self._sums = sums
+        self.samples += 1
+
+        n, sx, sy, sxx, sxy = sums
+        if self.samples < self.min_samples:
+            return
+        variance = n * sxx - sx * sx
+        if variance > 1e-6 * n * sxx:
+            slope = (n * sxy - sx * sy) / variance
+            intercept = (sy - slope * sx) / n
+            if slope > 0 and intercept >= 0:
+                self.slope, self.intercept = slope, intercept
+                return
+        if sx > 0:
+            self.intercept = self.prior_intercept
+            self.slope = max(0.0, (sy - self.intercept * n) / sx)
+
+    def value(self, x):
+        return self.intercept + self.slope * x
+
+
+class EncoderSelector:
+    """
+    Elige el codificador que minimiza el tiempo estimado de codificación +
+    subida para cada fragmento, según su duración y la velocidad de subida
+    medida. Con `mode` distinto de "auto" usa siempre el codificador indicado.
+
+    Tanto el tamaño como el tiempo de codificación se modelan como un coste
+    fijo (cabecera del contenedor, arranque del codificador) más un coste
+    proporcional a la duración, así que para fragmentos cortos gana el
+    formato más ligero y para los largos el más compacto. La subida se
+    estima con una regresión latencia = base + bytes / velocidad sobre las
+    últimas peticiones, así la latencia fija del servidor no se confunde
+    con el ancho de banda. Cada `explore_every` fragmentos se usa el
+    codificador que lleva más tiempo sin medirse, para que las estimaciones
+    de los que no se eligen también se corrijan.
+    """
+
+    def __init__(self, mode="auto", opus_bitrate=24000, upload_bytes_per_second=250000, explore_every=20):
+        self.mode = mode
+        self.encoders = {"wav": WavEncoder(), "flac": FlacEncoder()}
+        if opus_available:
+            self.encoders["opus"] = OpusEncoder(opus_bitrate)
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.explore_every = explore_every
+        self.lock = threading.Lock()
+        # Modelos por codificador: bytes y segundos de CPU en función de la duración
+        self.sizes = {name: LinearEstimate(encoder.prior_header_bytes, encoder.prior_bytes_per_second)
+                      for name, encoder in self.encoders.items()}
+        self.encode_times = {name: LinearEstimate(encoder.prior_setup_seconds, encoder.prior_encode_ratio)
+                             for name, encoder in self.encoders.items()}
+        # Segundos de subida en función de los bytes: base + bytes / velocidad
+        self.upload = LinearEstimate(0.0, 1.0 / upload_bytes_per_second)
+        self.chunks = 0
+        self.last_used = {name: 0 for name in self.encoders}
+        self.stats = {name: {"chunks": 0, "encode_time": 0.0, "bytes": 0, "wav_bytes": 0}
+                      for name in self.encoders}
+
+    def estimate(self, encoder, duration):
+        """Segundos estimados para codificar y subir `duration` segundos de audio"""
+        size = self.sizes[encoder.name].value(duration)
+        return self.encode_times[encoder.name].value(duration) + self.upload.value(size)
+
+    def choose(self, duration):
+        if self.mode in self.encoders:
+            return self.encoders[self.mode]
+        with self.lock:
+            self.chunks += 1
+            if self.explore_every and self.chunks % self.explore_every == 0:
+                # Volver a medir el codificador que más tiempo lleva sin usarse
+                name = min(self.last_used, key=self.last_used.get)
+            else:
+                name = min(self.encoders, key=lambda name: self.estimate(self.encoders[name], duration))
+            self.last_used[name] = self.chunks
+        return self.encoders[name]
+
+    def encode(self, audio, samplerate):
+        """Codifica con el codificador elegido y registra el coste y el ahorro"""
+        duration = len(audio) / samplerate
+        encoder = self.choose(duration)
+        start = time.perf_counter()
+        encoded = encoder.encode(audio, samplerate)
+        elapsed = time.perf_counter() - start
+        size = len(encoded.getbuffer())
+        ENCODE_SECONDS.observe(elapsed, encoder=encoder.name)
+
+        with self.lock:
+            self.sizes[encoder.name].add(duration, size)
+            self.encode_times[encoder.name].add(duration, elapsed)
+            stats = self.stats[encoder.name]
+            stats["chunks"] += 1
+            stats["encode_time"] += elapsed
+            stats["bytes"] += size
+            stats["wav_bytes"] += 2 * len(audio) * (audio.shape[1] if audio.ndim > 1 else 1) + 44
+        return encoded
+
+    def report_upload(self, size, seconds):
+        """Registra la duración de una subida con éxito (sin esperas del planificador ni reintentos)"""
+        with self.lock:
+            self.upload.add(size, seconds)
+            if self.upload.slope > 0:
+                self.upload_bytes_per_second = 1.0 / self.upload.slope
+
+    def summary(self):
+        """Resumen legible: tiempo de codificación frente a bytes ahorrados"""
+        parts = []
+        with self.lock:
+            for name, stats in self.stats.items():
+                if not stats["chunks"]:
+                    continue
+                saved = stats["wav_bytes"] - stats["bytes"]
+                parts.append(
+                    f"{name.upper()}: {stats['chunks']} fragmentos, "
+                    f"{stats['encode_time'] * 1000:.0f} ms codificando, "
+                    f"{saved / 1024:.0f} KB ahorrados"
+                )
+        return " | ".join(parts) if parts else "Sin fragmentos codificados"
+
+
+def resample_poly(signal, up, down, half_taps=16):
+    """
+    Remuestreo polifásico de una señal mono por el factor racional up/down.
+
+    Usa scipy si está disponible; si no, aplica un filtro FIR paso bajo
+    (sinc con ventana Kaiser) evaluando solo las fases necesarias, de modo
+    que el coste es proporcional a las muestras de salida y no a la señal
+    sobremuestreada.
+    """
+    factor = gcd(up, down)
+    up, down = up // factor, down // factor
+    if up == down:
+        return signal
+    if scipy_available:
+        return scipy_resample_poly(signal, up, down).astype(np.float32)
+
+    max_rate = max(up, down)
+    cutoff = 1.0 / max_rate
+    half_len = half_taps * max_rate
+    n = np.arange(-half_len, half_len + 1)
+    taps = (up * cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), 5.0)).astype(np.float32)
+
+    n_out = int(np.ceil(len(signal) * up / down))
+    pad = len(taps) // up + 1
+    padded = np.concatenate((np.zeros(pad, np.float32), signal.astype(np.float32), np.zeros(pad, np.float32)))
+    output = np.zeros(n_out, dtype=np.float32)
+
+    # Las salidas m y m + up comparten fase del filtro: se calculan juntas
+    for first in range(min(up, n_out)):
+        positions = np.arange(first, n_out, up) * down + half_len
+        phase = positions[0] % up
+        base = positions // up + pad
+        acc = np.zeros(len(base), dtype=np.float32)
+        for j, tap in enumerate(taps[phase::up]):
+            acc += tap * padded[base - j]
+        output[first::up] = acc
+    return output
+
+
+def to_whisper_format(audio, samplerate, target_rate=WHISPER_SAMPLERATE):
+    """Mezcla a mono y remuestrea a `target_rate`. Devuelve (audio, samplerate)"""
+    mono = audio.mean(axis=1) if audio.ndim > 1 else audio
+    if samplerate == target_rate:
+        return mono.astype(np.float32, copy=False), samplerate
+    return resample_poly(mono, target_rate, samplerate), target_rate
+
+
+def audio_fingerprint(audio, samplerate):
+    """
+    Huella del audio decodificado: hash del PCM en float32 junto con la
+    frecuencia de muestreo y la forma. Dos archivos con el mismo audio
+    (aunque cambien las etiquetas o la fecha) dan la misma huella.
+    """
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{samplerate}:{audio.shape}".encode())
+    digest.update(memoryview(audio).cast("B"))
+    return digest.hexdigest()
+
+
+def peak_level(audio):
+    """Amplitud máxima absoluta del buffer (0 si está vacío)"""
+    if len(audio) == 0:
+        return 0.0
+    return float(np.max(np.abs(audio)))
+
+
+def frame_features(audio, frame_length):
+    """
+    Calcula por frame (vectorizado) la energía RMS y la planitud espectral de
+    la mezcla mono de `audio`.
+    Solo se usan frames completos; el resto se ignora.
+    """
+    mono = audio.mean(axis=1) if audio.ndim > 1 else audio
+    n_frames = len(mono) // frame_length
+    frames = mono[:n_frames * frame_length].reshape(n_frames, frame_length)
+
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+
+    # Planitud espectral: media geométrica / media aritmética del espectro de potencia.
+    # Cercana a 1 para ruido, baja para señales tonales como la voz.
+    power = np.abs(np.fft.rfft(frames * np.hanning(frame_length), axis=1)) ** 2 + 1e-12
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+    return rms, flatness
+
+
+class VoiceActivityChunker:
+    """
+    Divide un flujo de audio en fragmentos usando detección de actividad de voz.
+
+    Recibe el audio por bloques con `feed()` y devuelve los fragmentos
+    cerrados como pares (inicio, fin) en frames absolutos desde el inicio de
+    la captura. Un fragmento se cierra en la primera pausa tras alcanzar la
+    duración mínima, o en el punto más silencioso del último tramo si llega
+    a la duración máxima. El silencio sin voz nunca forma un fragmento.
+    """
+
+    def __init__(self, samplerate, frame_ms=30, energy_threshold=0.005,
+                 noise_ratio=3.0, flatness_threshold=0.5, min_chunk=1.0,
+                 max_chunk=12.0, pause=0.4, min_speech=0.3, preroll=0.2,
+                 hangover=0.15):
+        self.samplerate = samplerate
+        self.frame_length = int(samplerate * frame_ms / 1000)
+        self.energy_threshold = energy_threshold
+        self.noise_ratio = noise_ratio
+        self.flatness_threshold = flatness_threshold
+        self.noise_floor = energy_threshold / noise_ratio
+
+        # Duraciones expresadas en frames de análisis
+        to_frames = lambda seconds: max(1, int(round(seconds * samplerate / self.frame_length)))
+        self.min_chunk_frames = to_frames(min_chunk)
+        self.max_chunk_frames = to_frames(max_chunk)
+        self.pause_frames = to_frames(pause)
+        self.min_speech_frames = to_frames(min_speech)
+        self.preroll_frames = to_frames(preroll)
+        self.hangover_frames = min(to_frames(hangover), self.pause_frames)
+
+        # Estado: posición analizada y fragmento en curso
+        self.position = 0
+        self.chunk_start = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._rms = []
+        self._speech = []
+        # Contadores del fragmento en curso, actualizados frame a frame
+        self._speech_count = 0
+        self._trailing_silence = 0
+
+    def is_speech(self, rms, flatness):
+        """Clasifica frames como voz según energía y planitud espectral"""
+        threshold = max(self.energy_threshold, self.noise_floor * self.noise_ratio)
+        speech = (rms > threshold) & (flatness < self.flatness_threshold)
+
+        # Seguir el nivel de ruido de fondo con los frames que no son voz
+        noise = rms[~speech]
+        if len(noise):
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * float(np.median(noise))
+        return speech
+
+    def feed(self, audio):
+        """Analiza un nuevo bloque y devuelve la lista de fragmentos cerrados"""
+        mono = audio.mean(axis=1) if audio.ndim > 1 else audio
+        if len(self._pending):
+            mono = np.concatenate((self._pending, mono))
+
+        usable = len(mono) // self.frame_length * self.frame_length
+        self._pending = np.array(mono[usable:], dtype=np.float32)
+        if usable == 0:
+            return []
+
+        rms, flatness = frame_features(mono[:usable], self.frame_length)
+        speech = self.is_speech(rms, flatness)
+
+        chunks = []
+        for frame_rms, frame_speech in zip(rms.tolist(), speech.tolist()):
+            self.position += self.frame_length
+            self._rms.append(frame_rms)
+            self._speech.append(frame_speech)
+            if frame_speech:
+                self._speech_count += 1
+                self._trailing_silence = 0
+            else:
+                self._trailing_silence += 1
+            chunk = self._update()
+            if chunk is not None:
+                chunks.append(chunk)
+        return chunks
+
+    def _update(self):
+        """Aplica la máquina de estados tras añadir un frame al fragmento en curso"""
+        # Sin voz todavía: avanzar el inicio conservando un pequeño pre-roll
+        if self._speech_count == 0:
+            if len(self._speech) > self.preroll_frames:
+                self._drop(len(self._speech) - self.preroll_frames)
+            return None
+
+        trailing_silence = self._trailing_silence
+        length = len(self._speech)
+        if trailing_silence >= self.pause_frames and length >= self.min_chunk_frames:
+            cut = length - trailing_silence + self.hangover_frames
+            return self._close(cut)
+
+        if length >= self.max_chunk_frames:
+            # Cortar en el frame más silencioso del último tercio
+            tail_start = length - max(1, length // 3)
+            cut = tail_start + int(np.argmin(self._rms[tail_start:])) + 1
+            return self._close(cut)
+
+        return None
+
+    def _close(self, cut):
+        """Cierra el fragmento en `cut` frames; descarta si no tiene voz suficiente"""
+        start = self.chunk_start
+        end = start + cut * self.frame_length
+        enough_speech = self._drop(cut) >= self.min_speech_frames
+        return (start, end) if enough_speech else None
+
+    def _drop(self, frames):
+        """
+        Quita frames del inicio del fragmento en curso y devuelve cuántos de
+        ellos eran voz. Cada frame se quita una sola vez: el coste total es
+        lineal en la duración de la captura
+        """
+        dropped_speech = sum(self._speech[:frames])
+        self.chunk_start += frames * self.frame_length
+        del self._rms[:frames]
+        del self._speech[:frames]
+        self._speech_count -= dropped_speech
+        # El silencio final no puede ser más largo que lo que queda
+        self._trailing_silence = min(self._trailing_silence, len(self._speech))
+        return dropped_speech
+
+    def flush(self):
+        """Cierra el fragmento pendiente al detener la captura (si tiene voz)"""
+        if not self._speech:
+            return None
+        return self._close(len(self._speech))
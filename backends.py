@@ -0,0 +1,158 @@
+import abc
+import threading
+
+import soundfile as sf
+
+from audio_processing import to_whisper_format
+from api_client import WhisperService
+from settings import get_settings
+
+try:
+    from faster_whisper import WhisperModel
+    faster_whisper_available = True
+except ImportError:
+    faster_whisper_available = False
+
+
+class TranscriptionBackend(abc.ABC):
+    """
+    Interfaz de un motor de transcripción.
+
+    Las subclases implementan `_transcribe()` sobre audio en memoria (numpy,
+    cualquier frecuencia y número de canales); la caché de transcripciones y
+    la lectura de archivos son comunes a todos los motores.
+    """
+
+    name = ""
+    label = ""
+    # Peticiones simultáneas que tiene sentido hacer (None: las de la configuración)
+    max_concurrency = None
+
+    @abc.abstractmethod
+    def model_id(self):
+        """Identificador del modelo, para distinguir entradas en la caché"""
+
+    def warm_up(self):
+        """Prepara el motor antes del primer fragmento (cargar el modelo, etc.)"""
+
+    @abc.abstractmethod
+    def _transcribe(self, audio, samplerate, language=None, prompt=None):
+        """Texto de `audio` (numpy, cualquier frecuencia y número de canales)"""
+
+    def transcribe(self, audio, samplerate, language=None, prompt=None, use_cache=False):
+        """Transcribe un buffer de audio; con `use_cache` consulta antes la caché"""
+        cache = WhisperService.get_transcription_cache() if use_cache else None
+        if cache is not None:
+            key = WhisperService.transcription_key(audio, samplerate, language, self.model_id(), prompt)
+            text = cache.get(key)
+            if text is not None:
+                return text
+
+        text = self._transcribe(audio, samplerate, language, prompt)
+
+        if cache is not None:
+            cache.put(key, text)
+        return text
+
+    def transcribe_file(self, file_path, language=None):
+        """Transcribe un archivo de audio, usando la caché de transcripciones"""
+        audio, samplerate = sf.read(file_path, dtype='float32')
+        return self.transcribe(audio, samplerate, language, use_cache=True)
+
+
+class OpenAIBackend(TranscriptionBackend):
+    """Transcripción con la API de Whisper de OpenAI"""
+
+    name = "openai"
+    label = "OpenAI Whisper (API)"
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def model_id(self):
+        return get_settings().model.whisper_model
+
+    def _transcribe(self, audio, samplerate, language=None, prompt=None):
+        return WhisperService.transcribe_buffer(self.api_key, audio, samplerate, language, prompt)
+
+    def transcribe_file(self, file_path, language=None):
+        # WhisperService también sube los formatos que soundfile no decodifica
+        return WhisperService.transcribe_file(self.api_key, file_path, language)
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    Transcripción local en CPU con faster-whisper (CTranslate2).
+
+    El modelo se carga una sola vez por configuración y se comparte entre
+    todos los fragmentos y sesiones; con cuantización int8 un modelo
+    pequeño responde a fragmentos cortos antes que un viaje de red.
+    """
+
+    name = "local"
+    label = "Whisper local (faster-whisper)"
+
+    _models = {}
+    _models_lock = threading.Lock()
+
+    def __init__(self, model_size="small", device="cpu", compute_type="int8",
+                 cpu_threads=0, num_workers=1, beam_size=1):
+        if not faster_whisper_available:
+            raise RuntimeError("faster-whisper no está instalado (pip install faster-whisper)")
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
+        self.beam_size = beam_size
+        # CTranslate2 procesa en paralelo tantas peticiones como workers tenga el modelo
+        self.max_concurrency = num_workers
+
+    def model_id(self):
+        return f"faster-whisper:{self.model_size}:{self.compute_type}"
+
+    def _model(self):
+        key = (self.model_size, self.device, self.compute_type, self.cpu_threads, self.num_workers)
+        with LocalWhisperBackend._models_lock:
+            model = LocalWhisperBackend._models.get(key)
+            if model is None:
+                print(f"Cargando modelo local de Whisper '{self.model_size}' ({self.compute_type})...")
+                model = WhisperModel(
+                    self.model_size, device=self.device, compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads, num_workers=self.num_workers
+                )
+                LocalWhisperBackend._models[key] = model
+            return model
+
+    def warm_up(self):
+        self._model()
+
+    def _transcribe(self, audio, samplerate, language=None, prompt=None):
+        # faster-whisper espera float32 mono a 16 kHz
+        audio, samplerate = to_whisper_format(audio, samplerate)
+        segments, _ = self._model().transcribe(
+            audio, language=language or None, initial_prompt=prompt,
+            beam_size=self.beam_size, condition_on_previous_text=False
+        )
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+def available_backends():
+    """Motores que se pueden usar en esta instalación: {nombre: etiqueta}"""
+    backends = {OpenAIBackend.name: OpenAIBackend.label}
+    if faster_whisper_available:
+        backends[LocalWhisperBackend.name] = LocalWhisperBackend.label
+    return backends
+
+
+def create_backend(name, api_key):
+    """Crea el motor `name` con los parámetros de la configuración actual"""
+    if name == LocalWhisperBackend.name:
+        local = get_settings().transcription
+        return LocalWhisperBackend(
+            local.local_model, local.local_device, local.local_compute_type,
+            local.local_cpu_threads, local.local_workers, local.local_beam_size
+        )
+    if name == OpenAIBackend.name:
+        return OpenAIBackend(api_key)
+    raise ValueError(f"Motor de transcripción desconocido: {name}")
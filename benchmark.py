@@ -0,0 +1,346 @@
+"""
+Benchmark de la transcripción continua sin interfaz gráfica.
+
+Reproduce audio sintético o de un archivo a través de
+ContinuousAudioRecorder -> AudioTranscriptionWorker, igual que el modo
+continuo de la aplicación, y mide cuánto tarda cada fragmento desde que se
+captura su último frame hasta que su texto se aplica en el hilo principal.
+El resultado se escribe como JSON para comparar cambios de troceado o
+codificación:
+
+    python benchmark.py --synthetic 120 --backend fake --speed 2 -o base.json
+    python benchmark.py --audio entrevista.wav --backend local \\
+        --set chunking.use_vad=false --set chunking.chunk_duration=4
+
+Con `--backend fake` se arranca fake_openai_server.py en el propio proceso.
+"""
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import soundfile as sf
+from PyQt5.QtCore import QCoreApplication, QTimer
+
+from settings import get_manager, get_settings
+from capture import PlaybackCaptureEngine
+from audio_processing import resample_poly
+from api_client import ApiKeyManager, ApiEngine
+from backends import create_backend
+from fake_openai_server import FakeOpenAIServer, FakeOpenAIConfig
+from gui import ContinuousAudioRecorder, AudioTranscriptionWorker
+
+try:
+    import psutil
+    psutil_available = True
+except ImportError:
+    psutil_available = False
+
+try:
+    import resource
+    resource_available = True
+except ImportError:
+    resource_available = False
+
+
+def synthetic_speech(duration, samplerate, seed=0):
+    """
+    Audio mono que imita el ritmo del habla: frases de 1,5-6 s de un tono
+    armónico modulado a ritmo de sílabas, separadas por pausas de 0,3-1,5 s
+    con ruido de fondo. Basta para que el VAD corte por las pausas.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(duration * samplerate)
+    audio = rng.normal(0, 0.001, total).astype(np.float32)
+    position = int(rng.uniform(0.2, 1.0) * samplerate)
+    while position < total:
+        length = min(int(rng.uniform(1.5, 6.0) * samplerate), total - position)
+        t = np.arange(length) / samplerate
+        pitch = rng.uniform(100, 220)
+        voice = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        syllables = 0.5 * (1 - np.cos(2 * np.pi * rng.uniform(3, 5) * t))
+        fade = np.minimum(1.0, np.minimum(t, t[::-1]) / 0.05)
+        audio[position:position + length] += (0.15 * voice * syllables * fade).astype(np.float32)
+        position += length + int(rng.uniform(0.3, 1.5) * samplerate)
+    return audio
+
+
+def load_audio(path, samplerate):
+    """Lee un archivo de audio, lo mezcla a mono y lo remuestrea a `samplerate`"""
+    audio, file_rate = sf.read(path, dtype='float32')
+    mono = audio.mean(axis=1) if audio.ndim > 1 else audio
+    if file_rate != samplerate:
+        mono = resample_poly(mono, samplerate, file_rate)
+    return mono
+
+
+def parse_override(text):
+    """Convierte "seccion.clave=valor" en un dict de configuración (valor en JSON o texto)"""
+    path, _, raw = text.partition("=")
+    if not path or not _:
+        raise argparse.ArgumentTypeError(f"Se esperaba clave=valor: {text}")
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    override = value
+    for key in reversed(path.split(".")):
+        override = {key: override}
+    return override
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    data = np.asarray(values)
+    return {
+        "count": len(values),
+        "mean": round(float(data.mean()), 4),
+        "p50": round(float(np.percentile(data, 50)), 4),
+        "p95": round(float(np.percentile(data, 95)), 4),
+        "p99": round(float(np.percentile(data, 99)), 4),
+        "max": round(float(data.max()), 4),
+    }
+
+
+def current_rss():
+    """Memoria residente actual en bytes (pico del proceso si no hay psutil)"""
+    if psutil_available:
+        return psutil.Process().memory_info().rss
+    if resource_available:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+class PipelineBenchmark:
+    """
+    Monta el grabador y el transcriptor sobre un PlaybackCaptureEngine y
+    recoge las métricas hasta que se ha transcrito todo el audio.
+    """
+
+    def __init__(self, audio, backend, api_key=None, language=None, speed=1.0, drain_timeout=120.0,
+                 sample_interval=0.25):
+        self.audio = audio
+        self.backend = backend
+        self.api_key = api_key
+        self.language = language
+        self.speed = speed
+        self.drain_timeout = drain_timeout
+        self.sample_interval = sample_interval
+        self.engine = None
+        self.recorder = None
+        self.worker = None
+        # Fragmentos emitidos por el grabador y aplicados por el transcriptor
+        self.emitted = 0
+        self.processed = 0
+        self.with_text = 0
+        self.capture_latencies = []   # último frame capturado -> texto aplicado
+        self.chunk_latencies = []     # fragmento listo -> texto aplicado
+        self.depth_samples = []
+        self.max_lag = 0.0
+        self.rss_samples = []
+        self.errors = []
+        self.drain_deadline = None
+
+    def create_engine(self, samplerate, channels, blocksize, buffer_frames):
+        self.engine = PlaybackCaptureEngine(
+            self.audio, samplerate, channels, self.speed,
+            blocksize=blocksize, buffer_frames=buffer_frames
+        )
+        return self.engine
+
+    def run(self):
+        app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+        self.recorder = ContinuousAudioRecorder(None, engine_factory=self.create_engine)
+        self.worker = AudioTranscriptionWorker(self.api_key, self.language, backend=self.backend)
+        self.recorder.chunk_ready.connect(self.worker.enqueue_chunk)
+        self.recorder.chunk_ready.connect(self.count_chunk)
+        self.recorder.error_occurred.connect(self.fail)
+        # Parada ordenada: al terminar el grabador, el transcriptor vacía la cola y sale
+        self.recorder.finished.connect(self.worker.finish)
+        self.worker.finished.connect(app.quit)
+        self.worker.chunk_processed.connect(self.record_chunk)
+        self.worker.queue_stats.connect(self.record_queue)
+        self.worker.error_occurred.connect(self.errors.append)
+
+        timer = QTimer()
+        timer.timeout.connect(lambda: self.sample(app))
+        timer.start(int(self.sample_interval * 1000))
+
+        cpu_start = time.process_time()
+        wall_start = time.monotonic()
+        self.worker.start()
+        self.recorder.start()
+        app.exec_()
+        timer.stop()
+        wall = time.monotonic() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        # Si se agotó el plazo de vaciado (o hubo un error) se abandona lo pendiente
+        self.recorder.stop()
+        self.recorder.wait()
+        self.worker.stop()
+        self.worker.wait()
+        return self.report(wall, cpu)
+
+    def count_chunk(self, chunk):
+        self.emitted += 1
+
+    def record_chunk(self, chunk, text):
+        now = time.monotonic()
+        self.processed += 1
+        if not text:
+            return
+        self.with_text += 1
+        captured = self.engine.capture_time(chunk.end_frame)
+        if captured is not None:
+            self.capture_latencies.append(now - captured)
+        self.chunk_latencies.append(now - chunk.created_at)
+
+    def record_queue(self, depth, lag):
+        self.max_lag = max(self.max_lag, lag)
+
+    def fail(self, message):
+        self.errors.append(message)
+        QCoreApplication.instance().quit()
+
+    def sample(self, app):
+        self.depth_samples.append(self.worker.chunk_queue.depth())
+        rss = current_rss()
+        if rss is not None:
+            self.rss_samples.append(rss)
+
+        if self.engine is None or not self.engine.finished.is_set():
+            return
+        if self.drain_deadline is None:
+            # Fin del audio: cerrar la última frase; el transcriptor termina al vaciar la cola
+            self.recorder.stop()
+            self.drain_deadline = time.monotonic() + self.drain_timeout
+            return
+        if time.monotonic() > self.drain_deadline:
+            app.quit()
+
+    def report(self, wall, cpu):
+        settings = get_settings()
+        queue = self.worker.chunk_queue
+        duration = len(self.audio) / settings.capture.samplerate
+        result = {
+            "audio_seconds": round(duration, 2),
+            "speed": self.speed,
+            "backend": self.backend.name,
+            "model": self.backend.model_id(),
+            "settings": {
+                "chunking": settings.chunking.as_dict(),
+                "encoding": settings.encoding.as_dict(),
+            },
+            "chunks": {
+                "emitted": self.emitted,
+                "processed": self.processed,
+                "with_text": self.with_text,
+                "merged": queue.merged,
+                "dropped": queue.dropped,
+                "pending": self.emitted - self.processed - queue.merged - queue.dropped,
+            },
+            "latency": {
+                "capture_to_text": percentiles(self.capture_latencies),
+                "chunk_to_text": percentiles(self.chunk_latencies),
+            },
+            "queue": {
+                "max_depth": max(self.depth_samples, default=0),
+                "mean_depth": round(float(np.mean(self.depth_samples)), 3) if self.depth_samples else 0.0,
+                "max_lag": round(self.max_lag, 3),
+            },
+            "cpu": {
+                "seconds": round(cpu, 3),
+                "percent": round(100 * cpu / wall, 1) if wall else 0.0,
+            },
+            "memory": {
+                "rss_peak_mb": round(max(self.rss_samples) / 2**20, 1) if self.rss_samples else None,
+                "rss_mean_mb": round(float(np.mean(self.rss_samples)) / 2**20, 1) if self.rss_samples else None,
+            },
+            "wall_seconds": round(wall, 2),
+            "xruns": self.engine.xruns if self.engine else 0,
+            "dropped_frames": self.engine.buffer.dropped_frames if self.engine else 0,
+            "errors": self.errors,
+        }
+        if self.backend.name == "openai":
+            scheduler = ApiEngine.instance(self.api_key).scheduler
+            result["api"] = {
+                "retries": scheduler.retries,
+                "rate_limited": scheduler.rate_limited,
+                "throttled_seconds": round(scheduler.throttled_seconds, 3),
+            }
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latencia de la transcripción continua")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--audio", help="archivo de audio a reproducir")
+    source.add_argument("--synthetic", type=float, default=60.0, metavar="SEGUNDOS",
+                        help="duración del audio sintético (por defecto)")
+    parser.add_argument("--seed", type=int, default=0, help="semilla del audio sintético")
+    parser.add_argument("--speed", type=float, default=1.0, help="velocidad de reproducción (1 = tiempo real)")
+    parser.add_argument("--backend", choices=("openai", "local", "fake"), default="fake")
+    parser.add_argument("--language", default=None)
+    parser.add_argument("--api-key", default=None, help="API key (por defecto la guardada)")
+    parser.add_argument("--fake-latency", default="lognormal:0.6:0.5",
+                        help="latencia del servidor simulado (ver fake_openai_server.py)")
+    parser.add_argument("--fake-rpm", type=int, default=0, help="límite de peticiones del servidor simulado")
+    parser.add_argument("--set", dest="overrides", action="append", type=parse_override, default=[],
+                        metavar="SECCION.CLAVE=VALOR", help="sustituye un valor de gpt_config.json")
+    parser.add_argument("--drain-timeout", type=float, default=120.0,
+                        help="segundos máximos de espera a los fragmentos pendientes al acabar el audio")
+    parser.add_argument("-o", "--output", help="archivo JSON de salida (por defecto, la salida estándar)")
+    args = parser.parse_args()
+
+    overrides = {}
+    for override in args.overrides:
+        for key, value in override.items():
+            if isinstance(value, dict) and isinstance(overrides.get(key), dict):
+                overrides[key].update(value)
+            else:
+                overrides[key] = value
+
+    server = None
+    api_key = args.api_key or ApiKeyManager.load_api_key()
+    backend_name = args.backend
+    if backend_name == "fake":
+        server = FakeOpenAIServer(config=FakeOpenAIConfig(latency=args.fake_latency, rpm=args.fake_rpm)).start()
+        overrides["api_base_url"] = server.base_url
+        api_key = api_key or "sk-benchmark"
+        backend_name = "openai"
+    elif backend_name == "openai" and not api_key:
+        parser.error("No hay API key: usa --api-key o guárdala desde la aplicación")
+    get_manager().set_overrides(overrides)
+
+    samplerate = get_settings().capture.samplerate
+    if args.audio:
+        audio = load_audio(args.audio, samplerate)
+    else:
+        audio = synthetic_speech(args.synthetic, samplerate, args.seed)
+
+    benchmark = PipelineBenchmark(
+        audio, create_backend(backend_name, api_key), api_key, args.language, args.speed, args.drain_timeout
+    )
+    try:
+        result = benchmark.run()
+    finally:
+        if server is not None:
+            server.stop()
+    if server is not None:
+        result["fake_server"] = {"latency": args.fake_latency, "rpm": args.fake_rpm, **server.stats}
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
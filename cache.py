@@ -0,0 +1,110 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache.sqlite3")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Normaliza un texto para usarlo en una clave: espacios colapsados y sin mayúsculas"""
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def make_key(*parts):
+    """Hash SHA-256 estable de una serie de valores serializables en JSON"""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class SqliteCache:
+    """
+    Caché persistente clave -> texto en una tabla SQLite, con expulsión LRU.
+
+    Cada entrada guarda cuándo se creó y cuándo se usó por última vez. Las
+    entradas más antiguas que `max_age` segundos no se devuelven y se borran
+    al escribir; si hay más de `max_entries`, se borran las menos usadas
+    recientemente. Varias cachés pueden compartir el mismo archivo usando
+    tablas distintas.
+    """
+
+    def __init__(self, table, path=CACHE_PATH, max_entries=500, max_age=30 * 86400):
+        if not table.isidentifier():
+            raise ValueError(f"Nombre de tabla no válido: {table}")
+        self.table = table
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        # Una sola conexión compartida entre hilos, protegida por el lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)"
+            )
+        # Estadísticas de la sesión
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Devuelve el valor guardado para `key`, o None si no está o ha caducado"""
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self.connection:
+                self.connection.execute(
+                    f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key)
+                )
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        """Guarda `value` para `key` y aplica la expulsión por edad y tamaño"""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self.connection.execute(
+                f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.max_age,)
+            )
+            self.connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        return (f"{self.hits} aciertos, {self.misses} fallos "
+                f"({self.hit_rate():.0%} de aciertos), {len(self)} entradas")
@@ -0,0 +1,182 @@
+import time
+import bisect
+import threading
+
+import numpy as np
+import sounddevice as sd
+
+from audio_buffer import LinearBuffer, RingBuffer
+from metering import AudioMeter
+
+
+class CaptureEngine:
+    """
+    Motor de captura basado en el callback de sounddevice.
+
+    El callback se ejecuta en el hilo de PortAudio y solo copia el bloque
+    recibido al RingBuffer; nunca bloquea ni reserva memoria. Los
+    consumidores esperan a que haya datos mediante un `threading.Event` en
+    lugar de hacer polling con `stream.read()` + `time.sleep()`.
+    """
+
+    def __init__(self, device_index, samplerate=48000, channels=2,
+                 buffer_seconds=30, blocksize=0, buffer_frames=None, max_frames=None):
+        self.device_index = device_index
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        # Si se indica, la captura termina sola al alcanzar este número de frames
+        self.max_frames = max_frames
+        if max_frames is not None:
+            # Una grabación de duración fija nunca da la vuelta: buffer lineal sin copia espejo
+            self.buffer = LinearBuffer(max_frames, channels)
+        else:
+            if buffer_frames is None:
+                buffer_frames = int(buffer_seconds * samplerate)
+            self.buffer = RingBuffer(buffer_frames, channels)
+        # Medidor de niveles que lee del buffer bajo demanda
+        self.meter = AudioMeter(self.buffer, samplerate)
+        self.data_ready = threading.Event()
+        self.stream = None
+        self.running = False
+        # Contadores de incidencias reportadas por PortAudio
+        self.xruns = 0
+        self.callbacks = 0
+
+    def _callback(self, indata, frames, time_info, status):
+        if status.input_overflow:
+            self.xruns += 1
+        finished = False
+        if self.max_frames is not None:
+            remaining = self.max_frames - self.buffer.write_pos
+            if remaining <= frames:
+                indata = indata[:remaining]
+                finished = True
+        self.buffer.write(indata)
+        self.callbacks += 1
+        self.data_ready.set()
+        if finished:
+            raise sd.CallbackStop
+
+    def start(self):
+        """Abre el stream y empieza a capturar"""
+        self.stream = sd.InputStream(
+            device=self.device_index,
+            channels=self.channels,
+            samplerate=self.samplerate,
+            blocksize=self.blocksize,
+            dtype='float32',
+            callback=self._callback
+        )
+        self.stream.start()
+        self.running = True
+        return self
+
+    def stop(self):
+        """Detiene la captura y despierta a los consumidores que estén esperando"""
+        self.running = False
+        if self.stream is not None:
+            try:
+                self.stream.stop()
+                self.stream.close()
+            finally:
+                self.stream = None
+        self.data_ready.set()
+
+    def wait_for(self, frames, timeout=None):
+        """
+        Bloquea hasta que haya al menos `frames` frames pendientes de leer.
+        Devuelve False si se agota el timeout o el motor se detiene antes.
+        """
+        while self.buffer.available() < frames:
+            if not self.running:
+                return False
+            self.data_ready.clear()
+            # Comprobar de nuevo para no perder un set() ocurrido antes del clear()
+            if self.buffer.available() >= frames:
+                break
+            if not self.data_ready.wait(timeout):
+                return False
+        return True
+
+    def wait_for_block(self, timeout=None):
+        """Bloquea hasta que llegue el siguiente bloque del callback"""
+        callbacks = self.callbacks
+        while self.running and self.callbacks == callbacks:
+            self.data_ready.clear()
+            if self.callbacks != callbacks:
+                break
+            if not self.data_ready.wait(timeout):
+                return False
+        return self.running
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class PlaybackCaptureEngine(CaptureEngine):
+    """
+    Motor de captura que reproduce un array de audio en lugar de leer un
+    dispositivo, para pruebas y benchmarks sin tarjeta de sonido.
+
+    Un hilo escribe el audio en el RingBuffer por bloques al ritmo del
+    tiempo real multiplicado por `speed`. Guarda el instante en que se
+    escribió cada bloque para poder medir la latencia desde la captura.
+    """
+
+    def __init__(self, audio, samplerate=48000, channels=2, speed=1.0,
+                 buffer_seconds=30, blocksize=0, buffer_frames=None):
+        super().__init__(None, samplerate, channels, buffer_seconds, blocksize, buffer_frames)
+        if speed <= 0:
+            raise ValueError("La velocidad de reproducción debe ser positiva")
+        audio = audio.reshape(len(audio), -1) if audio.ndim == 1 else audio
+        if audio.shape[1] != channels:
+            # Mezclar a mono y repetir en todos los canales
+            audio = np.repeat(audio.mean(axis=1, keepdims=True), channels, axis=1)
+        self.audio = np.ascontiguousarray(audio, dtype=np.float32)
+        self.speed = speed
+        self.thread = None
+        self.finished = threading.Event()
+        # Posición final de cada bloque escrito y el instante en que se escribió
+        self.block_ends = []
+        self.block_times = []
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._play, name="PlaybackCapture", daemon=True)
+        self.thread.start()
+        return self
+
+    def _play(self):
+        block = self.blocksize or int(self.samplerate * 0.01)
+        start = time.monotonic()
+        position = 0
+        while self.running and position < len(self.audio):
+            end = min(position + block, len(self.audio))
+            # Un bloque no está disponible hasta que se ha "grabado" entero
+            delay = start + end / (self.samplerate * self.speed) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.buffer.write(self.audio[position:end])
+            self.block_ends.append(end)
+            self.block_times.append(time.monotonic())
+            self.callbacks += 1
+            self.data_ready.set()
+            position = end
+        self.finished.set()
+
+    def capture_time(self, frame):
+        """Instante (time.monotonic) en que el frame `frame` llegó al buffer"""
+        index = bisect.bisect_left(self.block_ends, frame)
+        if index >= len(self.block_times):
+            return None
+        return self.block_times[index]
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.data_ready.set()
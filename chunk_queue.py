@@ -0,0 +1,101 @@
+import collections
+import queue
+import threading
+import time
+
+import numpy as np
+
+from audio_processing import AudioChunk
+
+
+class ChunkQueue:
+    """
+    Cola acotada de AudioChunk entre el grabador y el transcriptor.
+
+    Cuando Whisper va más lento que el tiempo real, la cola no crece sin
+    límite sino que aplica una política al llenarse:
+
+    - "merge": fusiona los dos fragmentos más antiguos en una sola petición
+      (hasta `max_merge_seconds`); si no es posible, descarta el más antiguo.
+    - "drop_oldest": descarta el fragmento más antiguo.
+    - "newest_first": aparta el fragmento más antiguo a una cola de relleno
+      que solo se procesa cuando no hay audio nuevo pendiente.
+
+    Expone la misma interfaz `put`/`get(timeout)` que `queue.Queue`.
+    """
+
+    POLICIES = ("merge", "drop_oldest", "newest_first")
+
+    def __init__(self, maxsize=4, policy="merge", max_merge_seconds=30.0, max_backfill=32):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Política de cola desconocida: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_merge_seconds = max_merge_seconds
+        self.items = collections.deque()
+        self.backfill = collections.deque(maxlen=max_backfill)
+        self.condition = threading.Condition()
+        # Contadores para la barra de estado
+        self.merged = 0
+        self.dropped = 0
+
+    def put(self, chunk):
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                self._make_room()
+            self.items.append(chunk)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Devuelve el siguiente fragmento; lanza queue.Empty si se agota el timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self.items and not self.backfill:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self.condition.wait(remaining)
+            if self.items:
+                return self.items.popleft()
+            return self.backfill.popleft()
+
+    def _make_room(self):
+        if self.policy == "merge" and len(self.items) >= 2:
+            first, second = self.items[0], self.items[1]
+            if first.duration + second.duration <= self.max_merge_seconds:
+                self.items.popleft()
+                self.items[0] = merge_chunks(first, second)
+                self.merged += 1
+                return
+        if self.policy == "newest_first":
+            if len(self.backfill) == self.backfill.maxlen:
+                # El deque acotado expulsará el relleno más antiguo
+                self.dropped += 1
+            self.backfill.append(self.items.popleft())
+            return
+        self.items.popleft()
+        self.dropped += 1
+
+    def depth(self):
+        """Fragmentos pendientes (incluido el relleno)"""
+        with self.condition:
+            return len(self.items) + len(self.backfill)
+
+    def lag(self):
+        """Segundos que lleva esperando el fragmento más antiguo de la cola principal"""
+        with self.condition:
+            if not self.items:
+                return 0.0
+            return time.monotonic() - self.items[0].created_at
+
+
+def merge_chunks(first, second):
+    """
+    Une dos fragmentos consecutivos en uno. Si el segundo se solapa con el
+    primero, se descarta la parte repetida.
+    """
+    overlap = max(0, first.end_frame - second.start_frame)
+    audio = np.concatenate((first.audio, second.audio[overlap:]))
+    merged = AudioChunk(audio, first.samplerate, first.start_frame, max(first.end_frame, second.end_frame))
+    merged.created_at = first.created_at
+    return merged
@@ -0,0 +1,290 @@
+"""
+Servidor HTTP local que imita los endpoints de OpenAI que usa la aplicación.
+
+Implementa `/v1/audio/transcriptions` y `/v1/chat/completions` (con y sin
+streaming) con latencias aleatorias, errores y respuestas 429 inyectados y
+límites de throughput, para probar y medir la canalización sin red:
+
+    python fake_openai_server.py --port 8765 --latency lognormal:0.8:0.5 --rpm 50
+
+y en gpt_config.json: "api_base_url": "http://127.0.0.1:8765/v1"
+"""
+import json
+import math
+import time
+import random
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LatencyDistribution:
+    """
+    Distribución de latencias en segundos, descrita como texto:
+    "fixed:0.5", "uniform:0.2:1.5", "normal:0.8:0.2" o "lognormal:mediana:sigma"
+    """
+
+    def __init__(self, spec="fixed:0"):
+        self.spec = spec
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(param) for param in params]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if expected.get(kind) != len(self.params):
+            raise ValueError(f"Distribución de latencia no válida: {spec}")
+
+    def sample(self):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, random.gauss(*self.params))
+        median, sigma = self.params
+        return random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+class RateLimiter:
+    """Ventana deslizante de un minuto: cuántas peticiones se admiten por minuto"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.times = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Devuelve 0 si se admite la petición, o los segundos hasta que se admitiría"""
+        if not self.per_minute:
+            return 0.0
+        now = time.monotonic()
+        with self.lock:
+            while self.times and now - self.times[0] >= 60:
+                self.times.pop(0)
+            if len(self.times) >= self.per_minute:
+                return 60 - (now - self.times[0])
+            self.times.append(now)
+            return 0.0
+
+
+class FakeOpenAIConfig:
+    """Comportamiento simulado del servidor"""
+
+    def __init__(self, latency="fixed:0.3", token_latency="fixed:0.02", error_rate=0.0,
+                 rate_limit_rate=0.0, rpm=0, bandwidth=0, max_concurrency=0,
+                 transcription_text="Texto de prueba del servidor local.", chat_text=None):
+        self.latency = LatencyDistribution(latency)
+        self.token_latency = LatencyDistribution(token_latency)
+        self.error_rate = error_rate              # probabilidad de un 500
+        self.rate_limit_rate = rate_limit_rate    # probabilidad de un 429 aleatorio
+        self.rpm = rpm                            # límite real de peticiones por minuto (0: sin límite)
+        self.bandwidth = bandwidth                # bytes/s de subida simulados (0: sin límite)
+        self.max_concurrency = max_concurrency    # peticiones atendidas a la vez (0: sin límite)
+        self.transcription_text = transcription_text
+        self.chat_text = chat_text or (
+            "Respuesta simulada del servidor local. "
+            "Sirve para medir la latencia hasta el primer token y el streaming."
+        )
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # --- Respuestas ---
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, error_type, code=None, headers=None):
+        self.server.stats["errors"][status] = self.server.stats["errors"].get(status, 0) + 1
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": code}}, headers)
+
+    def _injected_error(self):
+        """Aplica el límite de peticiones y los errores aleatorios. True si ya ha respondido"""
+        config = self.server.config
+        retry_after = self.server.limiter.acquire()
+        if retry_after > 0:
+            self._send_error(429, "Rate limit reached for requests", "requests", "rate_limit_exceeded",
+                             {"Retry-After": f"{retry_after:.3f}", "retry-after-ms": str(int(retry_after * 1000))})
+            return True
+        if random.random() < config.rate_limit_rate:
+            self._send_error(429, "Rate limit reached (inyectado)", "requests", "rate_limit_exceeded",
+                             {"Retry-After": "1"})
+            return True
+        if random.random() < config.error_rate:
+            self._send_error(500, "Error interno simulado", "server_error")
+            return True
+        return False
+
+    # --- Entrada ---
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        # Simular el tiempo de subida
+        if self.server.config.bandwidth:
+            time.sleep(length / self.server.config.bandwidth)
+        return body
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        body = self._read_body()
+        self.server.stats["requests"] += 1
+        with self.server.concurrency:
+            if self._injected_error():
+                return
+            if path.endswith("/audio/transcriptions"):
+                self._transcription(body)
+            elif path.endswith("/chat/completions"):
+                self._chat(body)
+            else:
+                self._send_error(404, f"Ruta desconocida: {path}", "invalid_request_error")
+
+    # --- Endpoints ---
+
+    def _transcription(self, body):
+        if not self.headers.get("Content-Type", "").startswith("multipart/form-data"):
+            self._send_error(400, "Se esperaba multipart/form-data", "invalid_request_error")
+            return
+        time.sleep(self.server.config.latency.sample())
+        number = next(self.server.counter)
+        text = f"{self.server.config.transcription_text} ({number}, {len(body) // 1024} KB)"
+        self._send_json(200, {"text": text})
+
+    def _chat(self, body):
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_error(400, "JSON no válido", "invalid_request_error")
+            return
+        config = self.server.config
+        model = request.get("model", "gpt-3.5-turbo")
+        words = config.chat_text.split(" ")
+        max_tokens = request.get("max_tokens")
+        if max_tokens:
+            words = words[:max_tokens]
+        completion_id = f"chatcmpl-local-{next(self.server.counter)}"
+        created = int(time.time())
+
+        # Latencia hasta el primer token
+        time.sleep(config.latency.sample())
+
+        if not request.get("stream"):
+            time.sleep(sum(config.token_latency.sample() for _ in words))
+            prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", [])) // 4
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                          "total_tokens": prompt_tokens + len(words)}
+            })
+            return
+
+        # Streaming: un evento SSE por palabra
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event({"role": "assistant", "content": ""})
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(config.token_latency.sample())
+            event({"content": word if index == 0 else " " + word})
+        event({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class _Unlimited:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Servidor simulado; se puede arrancar en segundo plano con `start()`"""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, config=None, verbose=False):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.config = config or FakeOpenAIConfig()
+        self.verbose = verbose
+        self.limiter = RateLimiter(self.config.rpm)
+        self.concurrency = (threading.BoundedSemaphore(self.config.max_concurrency)
+                            if self.config.max_concurrency else _Unlimited())
+        self.counter = itertools.count(1)
+        self.stats = {"requests": 0, "errors": {}}
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="FakeOpenAIServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.6:0.5",
+                        help="latencia hasta la respuesta o el primer token (fixed/uniform/normal/lognormal)")
+    parser.add_argument("--token-latency", default="fixed:0.02", help="latencia entre tokens en streaming")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probabilidad de responder 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="probabilidad de responder 429")
+    parser.add_argument("--rpm", type=int, default=0, help="peticiones por minuto admitidas (0: sin límite)")
+    parser.add_argument("--bandwidth", type=float, default=0, help="bytes/s de subida (0: sin límite)")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="peticiones atendidas a la vez")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(
+        args.latency, args.token_latency, args.error_rate, args.rate_limit_rate,
+        args.rpm, args.bandwidth, args.max_concurrency
+    )
+    server = FakeOpenAIServer(args.host, args.port, config, args.verbose)
+    print(f"Servidor simulado de OpenAI en {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Peticiones: {server.stats['requests']}, errores: {server.stats['errors']}")
+
+
+if __name__ == "__main__":
+    main()
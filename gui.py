@@ -2,64 +2,117 @@ import sys
 import os
 import time
 import queue
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QVBoxLayout, QHBoxLayout, 
-    QWidget, QLabel, QSpinBox, QTextEdit, QLineEdit, QComboBox,
+    QWidget, QLabel, QSpinBox, QTextEdit, QPlainTextEdit, QLineEdit, QComboBox,
     QProgressBar, QFileDialog, QMessageBox, QGroupBox, QStatusBar,
     QDialog, QDialogButtonBox, QFrame, QSplitter
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize, QMutex
-from PyQt5.QtGui import QPainter, QColor, QPen, QIcon, QFont
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize, QTimer
+from PyQt5.QtGui import QPainter, QColor, QPen, QIcon, QFont, QTextCursor
 
 # Importar módulos propios
 import recorder
-from api_client import ApiKeyManager, TranscriptionThread, WhisperService, GptQueryThread
+from capture import CaptureEngine
+from audio_processing import AudioChunk, VoiceActivityChunker, peak_level
+from metering import PeakHold
+from chunk_queue import ChunkQueue
+from transcript import (
+    stitch_transcripts, prompt_tail, fit_tokens, ReorderBuffer, TranscriptContext, SegmentStore
+)
+from settings import get_settings
+from questions import QuestionDetector
+from backends import OpenAIBackend, available_backends, create_backend
+from metrics import (
+    REGISTRY, MetricsServer, CAPTURE_XRUNS, CHUNK_BUILD_SECONDS, CHUNK_DELAY_SECONDS,
+    QUEUE_WAIT_SECONDS, TRANSCRIBE_SECONDS, UI_APPLY_SECONDS, GPT_PREFETCH
+)
+from api_client import (
+    ApiKeyManager, ApiEngine, ApiError, RequestGroup, TranscriptionThread, WhisperService, GptClient,
+    GptQueryThread
+)
 
 import sounddevice as sd
 import numpy as np
 import soundfile as sf
-import uuid
 
-class AudioLevelMonitor(QThread):
-    """Hilo para monitorear niveles de audio en tiempo real"""
-    level_updated = pyqtSignal(float)
+class AudioLevelMonitor:
+    """
+    Monitor de niveles del diálogo de configuración.
+
+    El callback de captura escribe en el buffer circular (sobrescribiendo lo
+    más antiguo) y el widget lee el medidor con su propio temporizador, así
+    que no hace falta ningún hilo que mantenga vivo el motor.
+    """
     
     def __init__(self, device_index):
-        super().__init__()
         self.device_index = device_index
-        self.running = False
-        self.samplerate = 44100
+        self.engine = None
+        capture = get_settings().capture
+        self.samplerate = capture.monitor_samplerate
+        self.channels = capture.channels
+        self.block_seconds = capture.block_seconds
     
-    def run(self):
-        self.running = True
-        
-        def callback(indata, frames, time, status):
-            if self.running:
-                volume_norm = np.linalg.norm(indata) / np.sqrt(frames)
-                self.level_updated.emit(volume_norm)
-        
-        try:
-            with sd.InputStream(device=self.device_index, channels=2, callback=callback,
-                              blocksize=int(self.samplerate * 0.1),
-                              samplerate=self.samplerate):
-                while self.running:
-                    sd.sleep(100)
-        except Exception as e:
-            print(f"Error en monitoreo de audio: {e}")
+    def start(self):
+        """Abre el dispositivo y devuelve el AudioMeter que lee el widget"""
+        block = int(self.samplerate * self.block_seconds)
+        self.engine = CaptureEngine(
+            self.device_index, self.samplerate, self.channels, buffer_seconds=1, blocksize=block
+        ).start()
+        return self.engine.meter
     
     def stop(self):
-        self.running = False
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
 
 class AudioLevelWidget(QFrame):
-    """Widget para visualizar niveles de audio en tiempo real"""
-    def __init__(self, parent=None):
+    """
+    Widget para visualizar niveles de audio en tiempo real.
+    Con `set_meter` lee un AudioMeter a una frecuencia fija (por defecto
+    30 fps) con retención de pico y caída gradual, en lugar de repintar con
+    cada bloque de audio.
+    """
+    def __init__(self, parent=None, fps=30):
         super().__init__(parent)
         self.setMinimumHeight(30)
         self.setFrameShape(QFrame.StyledPanel)
         self.level = 0.0
+        self.peak = 0.0
+        self.clipping = False
+        self.meter = None
+        self.ballistics = PeakHold()
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(1000 / fps))
+        self.timer.timeout.connect(self.refresh)
+    
+    def set_meter(self, meter):
+        """Conecta (o desconecta con None) el medidor que alimenta el widget"""
+        self.meter = meter
+        if meter is None:
+            self.timer.stop()
+            self.set_level(0.0)
+        else:
+            self.timer.start()
+    
+    def refresh(self):
+        """Lee el medidor y repinta solo si cambia lo que se muestra"""
+        reading = self.meter.measure() if self.meter else None
+        raw_level = 0.0
+        clipping = False
+        if reading is not None:
+            raw_level = min(reading.level * 5, 1.0)  # Amplificar para mejor visualización
+            clipping = reading.is_clipping
+        level, peak = self.ballistics.update(raw_level)
+        if (abs(level - self.level) > 0.002 or abs(peak - self.peak) > 0.002
+                or clipping != self.clipping):
+            self.level, self.peak, self.clipping = level, peak, clipping
+            self.update()
         
     def set_level(self, level):
         self.level = min(level * 5, 1.0)  # Amplificar para mejor visualización
+        self.peak = self.level
         self.update()
         
     def paintEvent(self, event):
@@ -80,6 +133,15 @@ class AudioLevelWidget(QFrame):
             
         painter.fillRect(0, 0, width, self.height(), color)
         
+        # Dibujar pico retenido
+        peak_x = int(self.width() * self.peak)
+        if peak_x > 0:
+            painter.fillRect(max(peak_x - 2, 0), 0, 2, self.height(), QColor(230, 230, 230))
+        
+        # Indicador de saturación
+        if self.clipping:
+            painter.fillRect(self.width() - 6, 0, 6, self.height(), QColor(255, 0, 0))
+        
         # Dibujar marcas de nivel
         pen = QPen(QColor(100, 100, 100))
         painter.setPen(pen)
@@ -176,7 +238,7 @@ class AudioDeviceSetupDialog(QDialog):
         self.load_monitor_devices()
         
         # Inicializar monitor
-        self.monitor_thread = None
+        self.monitor = None
         self.monitoring = False
     
     def load_input_devices(self):
@@ -259,18 +321,18 @@ class AudioDeviceSetupDialog(QDialog):
             try:
                 device_index = self.monitor_device.currentData()
                 if device_index is not None:
-                    self.monitor_thread = AudioLevelMonitor(device_index)
-                    self.monitor_thread.level_updated.connect(self.level_widget.set_level)
-                    self.monitor_thread.start()
+                    self.monitor = AudioLevelMonitor(device_index)
+                    self.level_widget.set_meter(self.monitor.start())
                     self.monitoring = True
                     self.monitor_button.setText("Detener Monitoreo")
             except Exception as e:
                 QMessageBox.warning(self, "Error", f"No se pudo iniciar el monitoreo: {e}")
         else:
             # Detener monitoreo
-            if self.monitor_thread:
-                self.monitor_thread.stop()
-                self.monitor_thread = None
+            if self.monitor:
+                self.monitor.stop()
+                self.monitor = None
+            self.level_widget.set_meter(None)
             self.monitoring = False
             self.monitor_button.setText("Iniciar Monitoreo")
     
@@ -327,50 +389,80 @@ class AudioRecordTranscribeThread(QThread):
     update_partial_transcript = pyqtSignal(str)
     recording_complete = pyqtSignal(bool, str)
 
-    def __init__(self, filename, duration, device_index, api_key, language_code):
+    def __init__(self, filename, duration, device_index, api_key, language_code,
+                 incremental=True, finalize=False, backend=None):
         super().__init__()
         self.filename = filename
         self.duration = duration
         self.device_index = device_index
         self.api_key = api_key
         self.language_code = language_code
-        self.samplerate = 48000
-        self.channels = 2
-        self.chunk_duration = 5  # segundos por fragmento para transcribir
+        self.backend = backend or OpenAIBackend(api_key)
+        settings = get_settings()
+        self.samplerate = settings.capture.samplerate
+        self.channels = settings.capture.channels
+        # segundos por fragmento para transcribir
+        self.chunk_duration = settings.chunking.record_chunk_duration
+        # Incremental: solo se sube el audio nuevo, usando el texto previo como contexto.
+        # Si no, cada paso vuelve a transcribir todo lo grabado (coste O(N²)).
+        self.incremental = incremental
+        # Retranscribir la grabación completa una vez al terminar
+        self.finalize = finalize
 
     def run(self):
         try:
             total_frames = int(self.duration * self.samplerate)
             chunk_frames = int(self.chunk_duration * self.samplerate)
-            audio_buffer = np.zeros((0, self.channels), dtype=np.float32)
-            recorded = []
-            start_time = time.time()
-            stream = sd.InputStream(device=self.device_index, channels=self.channels, samplerate=self.samplerate)
-            stream.start()
+            engine = CaptureEngine(
+                self.device_index, self.samplerate, self.channels, max_frames=total_frames
+            )
             frames_recorded = 0
+            frames_transcribed = 0
             partial_transcript = ""
-            while frames_recorded < total_frames:
-                frames_to_read = min(chunk_frames, total_frames - frames_recorded)
-                chunk = stream.read(frames_to_read)[0]
-                audio_buffer = np.concatenate((audio_buffer, chunk))
-                frames_recorded += frames_to_read
-                # Guardar fragmento temporal para transcripción
-                temp_chunk_file = self.filename + ".chunk.wav"
-                import soundfile as sf
-                sf.write(temp_chunk_file, audio_buffer, self.samplerate)
-                # Llamar a Whisper para transcribir el fragmento
-                try:
-                    from api_client import WhisperService
-                    partial = WhisperService.transcribe_file(self.api_key, temp_chunk_file, self.language_code)
-                    if partial:
-                        partial_transcript = partial
-                        self.update_partial_transcript.emit(partial_transcript)
-                except Exception as e:
-                    self.update_partial_transcript.emit(f"[Error transcribiendo: {e}]")
-                self.update_progress.emit(int(100 * frames_recorded / total_frames))
-            stream.stop()
+            with engine:
+                while frames_recorded < total_frames:
+                    frames_to_read = min(chunk_frames, total_frames - frames_recorded)
+                    # La captura sigue en el callback mientras se transcribe
+                    if not engine.wait_for(frames_recorded + frames_to_read, timeout=2.0):
+                        raise RuntimeError("El dispositivo de audio dejó de enviar datos")
+                    # Incluir todo lo que se haya grabado durante la última transcripción
+                    frames_recorded = engine.buffer.available()
+                    try:
+                        if self.incremental:
+                            # Solo el audio nuevo, con el final del texto previo como prompt
+                            new_text = self.backend.transcribe(
+                                engine.buffer.view(frames_transcribed, frames_recorded - frames_transcribed),
+                                self.samplerate, self.language_code,
+                                prompt=prompt_tail(partial_transcript)
+                            )
+                            frames_transcribed = frames_recorded
+                            if new_text:
+                                partial_transcript = f"{partial_transcript} {new_text}".strip()
+                                self.update_partial_transcript.emit(partial_transcript)
+                        else:
+                            # Llamar a Whisper con el audio acumulado directamente desde memoria
+                            partial = self.backend.transcribe(
+                                engine.buffer.peek(frames_recorded),
+                                self.samplerate, self.language_code
+                            )
+                            if partial:
+                                partial_transcript = partial
+                                self.update_partial_transcript.emit(partial_transcript)
+                    except Exception as e:
+                        self.update_partial_transcript.emit(f"[Error transcribiendo: {e}]")
+                    self.update_progress.emit(int(100 * frames_recorded / total_frames))
+            if engine.xruns:
+                print(f"⚠ Se perdieron {engine.xruns} bloques de audio durante la grabación")
+                CAPTURE_XRUNS.inc(engine.xruns)
+            if self.incremental and self.finalize:
+                # Una única pasada sobre la grabación completa para el texto definitivo
+                final_text = self.backend.transcribe(
+                    engine.buffer.peek(), self.samplerate, self.language_code
+                )
+                if final_text:
+                    self.update_partial_transcript.emit(final_text)
             # Guardar audio completo
-            sf.write(self.filename, audio_buffer, self.samplerate)
+            sf.write(self.filename, engine.buffer.read(), self.samplerate)
             self.recording_complete.emit(True, self.filename)
         except Exception as e:
             self.recording_complete.emit(False, str(e))
@@ -453,7 +545,7 @@ class ApiKeyDialog(QDialog):
 class AudioRecorderThread(QThread):
     """Hilo para grabar audio sin bloquear la interfaz"""
     update_progress = pyqtSignal(int)
-    update_level = pyqtSignal(float)
+    meter_ready = pyqtSignal(object)  # AudioMeter
     recording_complete = pyqtSignal(bool, str)
     
     def __init__(self, filename, duration, use_virtual_cable, device_index=None):
@@ -462,8 +554,11 @@ class AudioRecorderThread(QThread):
         self.duration = duration
         self.use_virtual_cable = use_virtual_cable
         self.device_index = device_index
-        self.samplerate = 48000
-        self.channels = 2
+        capture = get_settings().capture
+        self.samplerate = capture.samplerate
+        self.channels = capture.channels
+        self.block_seconds = capture.block_seconds
+        self.silence_threshold = capture.silence_threshold
     
     def run(self):
         try:
@@ -482,46 +577,43 @@ class AudioRecorderThread(QThread):
             
             # Iniciar grabación
             total_frames = int(self.duration * self.samplerate)
-            audio_buffer = np.zeros((0, self.channels), dtype=np.float32)
+            block = int(self.samplerate * self.block_seconds)
             
-            # Configurar stream
-            stream = sd.InputStream(device=device_idx, channels=self.channels, samplerate=self.samplerate)
-            stream.start()
+            # Configurar motor de captura (se detiene solo al llegar a total_frames)
+            engine = CaptureEngine(
+                device_idx, self.samplerate, self.channels, blocksize=block, max_frames=total_frames
+            )
             
             frames_recorded = 0
-            start_time = time.time()
+            last_progress = -1
             
-            # Grabar en chunks para actualizar progreso
-            while frames_recorded < total_frames:
-                # Determinar tamaño de chunk
-                chunk_size = min(int(self.samplerate * 0.1), total_frames - frames_recorded)
-                
-                # Leer chunk
-                chunk, overflowed = stream.read(chunk_size)
-                audio_buffer = np.concatenate((audio_buffer, chunk))
-                
-                # Calcular nivel de audio y emitir señal
-                level = np.linalg.norm(chunk) / np.sqrt(chunk_size)
-                self.update_level.emit(level)
+            with engine:
+                # La interfaz lee los niveles del medidor a su propio ritmo
+                self.meter_ready.emit(engine.meter)
                 
-                # Actualizar contador y progreso
-                frames_recorded += chunk_size
-                progress = int(100 * frames_recorded / total_frames)
-                self.update_progress.emit(progress)
-                
-                # No sobrecargar la CPU
-                time.sleep(0.01)
+                # Esperar bloque a bloque para actualizar progreso
+                while frames_recorded < total_frames:
+                    target = min(frames_recorded + block, total_frames)
+                    if not engine.wait_for(target, timeout=2.0):
+                        raise RuntimeError("El dispositivo de audio dejó de enviar datos")
+                    
+                    # Actualizar contador y progreso (solo si cambia el porcentaje)
+                    frames_recorded = engine.buffer.available()
+                    progress = int(100 * frames_recorded / total_frames)
+                    if progress != last_progress:
+                        self.update_progress.emit(progress)
+                        last_progress = progress
             
-            # Detener stream
-            stream.stop()
-            stream.close()
+            if engine.xruns:
+                print(f"⚠ Se perdieron {engine.xruns} bloques de audio durante la grabación")
+                CAPTURE_XRUNS.inc(engine.xruns)
             
             # Guardar archivo
-            import soundfile as sf
-            sf.write(self.filename, audio_buffer, self.samplerate)
+            audio = engine.buffer.read()
+            sf.write(self.filename, audio, self.samplerate)
             
             # Verificar si el audio contiene sonido real
-            if recorder.verificar_audio(self.filename):
+            if recorder.verificar_buffer(audio, self.silence_threshold):
                 self.recording_complete.emit(True, self.filename)
             else:
                 self.recording_complete.emit(False, "La grabación contiene solo silencio. Verifica la configuración.")
@@ -531,112 +623,96 @@ class AudioRecorderThread(QThread):
 
 class ContinuousRecordTranscribeThread(QThread):
     """Hilo para grabar y transcribir audio continuamente"""
-    update_level = pyqtSignal(float)
-    update_transcription = pyqtSignal(str)
+    meter_ready = pyqtSignal(object)  # AudioMeter
+    segment_transcribed = pyqtSignal(str)  # solo el texto nuevo de cada fragmento
     status_update = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, api_key, device_index, language_code, chunk_duration=10):
+    def __init__(self, api_key, device_index, language_code, chunk_duration=10, backend=None):
         super().__init__()
         self.api_key = api_key
+        self.backend = backend or OpenAIBackend(api_key)
         self.device_index = device_index
         self.language_code = language_code
         self.running = False
-        self.samplerate = 48000
-        self.channels = 2
+        capture = get_settings().capture
+        self.samplerate = capture.samplerate
+        self.channels = capture.channels
+        self.block_seconds = capture.block_seconds
+        self.silence_threshold = capture.silence_threshold
         self.chunk_duration = chunk_duration  # segundos por fragmento
-        self.temp_dir = os.path.join(os.getcwd(), "temp_audio")
         
-        # Crear directorio temporal si no existe
-        if not os.path.exists(self.temp_dir):
-            os.makedirs(self.temp_dir)
-            
-        # Transcripción acumulada
-        self.full_transcription = ""
+        # Transcripción acumulada, por segmentos con marcas de tiempo
+        self.store = SegmentStore(self.samplerate)
     
     def run(self):
         try:
             self.running = True
             self.status_update.emit("Iniciando grabación continua...")
             
-            # Configurar stream
-            stream = sd.InputStream(
-                device=self.device_index, 
-                channels=self.channels, 
-                samplerate=self.samplerate
-            )
-            stream.start()
-            
             chunk_frames = int(self.chunk_duration * self.samplerate)
+            block = int(self.samplerate * self.block_seconds)
+            
+            # Configurar motor de captura (sigue grabando mientras se transcribe)
+            engine = CaptureEngine(
+                self.device_index, self.samplerate, self.channels,
+                blocksize=block, buffer_frames=chunk_frames * 3
+            ).start()
+            self.meter_ready.emit(engine.meter)
+            xruns_reported = 0
             
             while self.running:
-                # 1. Grabar fragmento
+                # 1. Esperar a tener un fragmento completo
                 self.status_update.emit("Grabando fragmento de audio...")
-                audio_buffer = np.zeros((0, self.channels), dtype=np.float32)
                 
-                for _ in range(0, chunk_frames, 4800):  # Leer en bloques pequeños
-                    if not self.running:
-                        break
-                        
-                    frames_to_read = min(4800, chunk_frames - len(audio_buffer))
-                    if frames_to_read <= 0:
-                        break
-                        
-                    chunk, overflowed = stream.read(frames_to_read)
-                    audio_buffer = np.concatenate((audio_buffer, chunk))
-                    
-                    # Actualizar nivel de audio
-                    level = np.linalg.norm(chunk) / np.sqrt(len(chunk))
-                    self.update_level.emit(level)
-                    
-                    # Pequeña pausa para no sobrecargar la CPU
-                    time.sleep(0.01)
+                while self.running and engine.buffer.available() < chunk_frames:
+                    engine.wait_for(chunk_frames, timeout=0.5)
                 
                 if not self.running:
                     break
                 
-                # 2. Guardar fragmento en archivo temporal
-                temp_file = os.path.join(self.temp_dir, f"chunk_{uuid.uuid4()}.wav")
-                sf.write(temp_file, audio_buffer, self.samplerate)
+                if engine.xruns > xruns_reported:
+                    print(f"⚠ Desbordamiento de entrada: {engine.xruns} bloques perdidos")
+                    CAPTURE_XRUNS.inc(engine.xruns - xruns_reported)
+                    xruns_reported = engine.xruns
+                
+                # 2. Tomar el fragmento del buffer (vista, sin pasar por disco)
+                start_frame = engine.buffer.read_pos
+                audio_chunk = engine.buffer.read(chunk_frames)
                 
                 # Verificar si hay audio real
-                if not recorder.verificar_audio(temp_file):
+                if peak_level(audio_chunk) < self.silence_threshold:
                     self.status_update.emit("El fragmento contiene solo silencio, continuando...")
                     continue
                 
                 # 3. Transcribir fragmento
                 self.status_update.emit("Transcribiendo fragmento...")
                 try:
-                    from api_client import WhisperService
-                    transcription = WhisperService.transcribe_file(
-                        self.api_key, temp_file, self.language_code
+                    transcription = self.backend.transcribe(
+                        audio_chunk, self.samplerate, self.language_code
                     )
                     
-                    if transcription and transcription != "[Error" and len(transcription) > 0:
+                    if transcription:
                         # Añadir a la transcripción completa
-                        if self.full_transcription:
-                            self.full_transcription += " " + transcription
-                        else:
-                            self.full_transcription = transcription
-                            
-                        # Emitir la transcripción completa
-                        self.update_transcription.emit(self.full_transcription)
+                        self.store.append(
+                            transcription, start_frame, start_frame + len(audio_chunk), len(self.store) + 1
+                        )
+                        self.segment_transcribed.emit(transcription)
                         self.status_update.emit(f"Transcripción actualizada ({len(transcription)} caracteres)")
                     else:
                         self.status_update.emit("No se detectó texto en el fragmento")
                         
+                except ApiError as e:
+                    if e.retryable:
+                        # Límite de peticiones o fallo transitorio: se pierde el fragmento, no la sesión
+                        self.status_update.emit(f"Fragmento sin transcribir tras varios reintentos: {e}")
+                    else:
+                        self.error_occurred.emit(f"Error al transcribir: {str(e)}")
                 except Exception as e:
                     self.error_occurred.emit(f"Error al transcribir: {str(e)}")
-                
-                # Eliminar archivo temporal
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
             
             # Cerrar stream cuando se detiene
-            stream.stop()
-            stream.close()
+            engine.stop()
             self.status_update.emit("Grabación continua detenida")
             
         except Exception as e:
@@ -649,166 +725,383 @@ class ContinuousRecordTranscribeThread(QThread):
 
 class ContinuousAudioRecorder(QThread):
     """Hilo dedicado a grabar audio continuamente sin interrupciones"""
-    update_level = pyqtSignal(float)
-    chunk_ready = pyqtSignal(str)
+    meter_ready = pyqtSignal(object)  # AudioMeter
+    chunk_ready = pyqtSignal(object)  # AudioChunk
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, device_index, chunk_duration=3):
+    def __init__(self, device_index, chunk_duration=None, use_vad=None, overlap=None, engine_factory=None):
         super().__init__()
         self.device_index = device_index
+        # Crea el motor de captura: (samplerate, canales, bloque, frames del buffer) -> motor.
+        # Por defecto se graba del dispositivo; el benchmark reproduce audio sintético.
+        self.engine_factory = engine_factory
         self.running = False
-        self.samplerate = 48000
-        self.channels = 2
-        self.chunk_duration = chunk_duration  # segundos por fragmento
-        self.temp_dir = os.path.join(os.getcwd(), "temp_audio")
-        
-        # Crear directorio temporal si no existe
-        if not os.path.exists(self.temp_dir):
-            os.makedirs(self.temp_dir)
+        # Los parámetros no indicados se toman de la configuración
+        settings = get_settings()
+        chunking = settings.chunking
+        if chunk_duration is None:
+            chunk_duration = chunking.chunk_duration
+        if use_vad is None:
+            use_vad = chunking.use_vad
+        if overlap is None:
+            overlap = chunking.overlap
+        self.samplerate = settings.capture.samplerate
+        self.channels = settings.capture.channels
+        self.block_seconds = settings.capture.block_seconds
+        self.chunk_duration = chunk_duration  # segundos por fragmento (sin VAD)
+        # Segundos que cada fragmento repite del anterior para no cortar palabras
+        self.overlap_frames = int(overlap * self.samplerate)
+        # Con VAD los fragmentos se cierran en las pausas de la voz
+        self.vad = None
+        if use_vad:
+            self.vad = VoiceActivityChunker(
+                self.samplerate,
+                energy_threshold=chunking.vad_energy_threshold,
+                min_chunk=chunking.vad_min_chunk,
+                max_chunk=chunking.vad_max_chunk,
+                pause=chunking.vad_pause
+            )
             
     def run(self):
         try:
             self.running = True
             
-            # Configurar stream
+            # Configurar motor de captura
             chunk_frames = int(self.chunk_duration * self.samplerate)
-            stream = sd.InputStream(
-                device=self.device_index, 
-                channels=self.channels, 
-                samplerate=self.samplerate
-            )
-            stream.start()
+            block = int(self.samplerate * self.block_seconds)
+            if self.vad is not None:
+                chunk_frames = self.vad.max_chunk_frames * self.vad.frame_length
             
-            audio_buffer = np.zeros((0, self.channels), dtype=np.float32)
-            frames_collected = 0
+            # Buffer circular con margen para varios fragmentos
+            engine = self.create_engine(block, chunk_frames * 2 + self.overlap_frames).start()
+            self.meter_ready.emit(engine.meter)
+            xruns_reported = 0
+            analyzed = 0
+            # Fin del último fragmento emitido (None hasta el primero)
+            last_end = None
             
             while self.running:
-                # Determinar tamaño de chunk
-                chunk_size = min(int(self.samplerate * 0.1), chunk_frames - frames_collected)
+                # Esperar al siguiente bloque del callback
+                if not engine.wait_for_block(timeout=0.5):
+                    continue
                 
-                # Leer chunk
-                chunk, overflowed = stream.read(chunk_size)
-                audio_buffer = np.concatenate((audio_buffer, chunk))
-                frames_collected += chunk_size
+                if engine.xruns > xruns_reported:
+                    print(f"⚠ Desbordamiento de entrada: {engine.xruns} bloques perdidos")
+                    CAPTURE_XRUNS.inc(engine.xruns - xruns_reported)
+                    xruns_reported = engine.xruns
                 
-                # Calcular nivel de audio y emitir señal
-                level = np.linalg.norm(chunk) / np.sqrt(chunk_size)
-                self.update_level.emit(level)
+                if self.vad is not None:
+                    # Analizar solo el audio nuevo y emitir los fragmentos cerrados en pausas
+                    written = engine.buffer.write_pos
+                    new_audio = engine.buffer.view(analyzed, written - analyzed)
+                    analyzed = written
+                    for start, end in self.vad.feed(new_audio):
+                        self.emit_chunk(engine.buffer, start, end, last_end)
+                        last_end = end
+                    # El audio anterior al fragmento en curso (menos el solape) ya no se necesita
+                    keep_from = self.vad.chunk_start - self.overlap_frames
+                    if keep_from > engine.buffer.read_pos:
+                        engine.buffer.consume(keep_from - engine.buffer.read_pos)
+                    continue
                 
                 # Cuando hemos acumulado los frames para un chunk completo
-                if frames_collected >= chunk_frames:
-                    # Generar nombre de archivo único
-                    temp_file = os.path.join(self.temp_dir, f"chunk_{uuid.uuid4()}.wav")
-                    
-                    # Guardar chunk
-                    sf.write(temp_file, audio_buffer, self.samplerate)
-                    
-                    # Emitir señal con el archivo listo
-                    self.chunk_ready.emit(temp_file)
-                    
-                    # Reiniciar buffer y contador
-                    audio_buffer = np.zeros((0, self.channels), dtype=np.float32)
-                    frames_collected = 0
-                
-                # No sobrecargar la CPU
-                time.sleep(0.01)
+                while engine.buffer.available() >= chunk_frames:
+                    start = engine.buffer.read_pos
+                    self.emit_chunk(engine.buffer, start, start + chunk_frames)
+                    # Conservar el final del fragmento como inicio del siguiente
+                    engine.buffer.consume(chunk_frames - self.overlap_frames)
             
             # Cerrar stream cuando se detiene
-            stream.stop()
-            stream.close()
+            engine.stop()
+            
+            # Enviar la última frase si quedó a medias
+            if self.vad is not None:
+                last = self.vad.flush()
+                if last is not None:
+                    self.emit_chunk(engine.buffer, *last, last_end)
             
         except Exception as e:
             self.running = False
             self.error_occurred.emit(f"Error en grabación continua: {str(e)}")
     
+    def create_engine(self, blocksize, buffer_frames):
+        if self.engine_factory is not None:
+            return self.engine_factory(self.samplerate, self.channels, blocksize, buffer_frames)
+        return CaptureEngine(
+            self.device_index, self.samplerate, self.channels,
+            blocksize=blocksize, buffer_frames=buffer_frames
+        )
+    
+    def emit_chunk(self, buffer, start, end, previous_end=None):
+        """
+        Copia el tramo [start, end) del buffer, ampliado hacia atrás con el
+        solape configurado, y lo envía al transcriptor
+        """
+        with CHUNK_BUILD_SECONDS.time():
+            if previous_end is not None and start == previous_end:
+                # Con VAD solo se solapa si el fragmento anterior termina justo donde empieza este
+                start = max(start - self.overlap_frames, buffer.read_pos)
+            # Copiar el fragmento una sola vez: viaja a otro hilo
+            audio = np.array(buffer.view(start, end - start))
+        # Audio capturado después del final del fragmento mientras se decidía dónde cortar
+        CHUNK_DELAY_SECONDS.observe(max(0, buffer.write_pos - end) / self.samplerate)
+        self.chunk_ready.emit(AudioChunk(audio, self.samplerate, start))
+    
     def stop(self):
         """Detiene la grabación continua"""
         self.running = False
 
 class AudioTranscriptionWorker(QThread):
     """Hilo dedicado a transcribir los fragmentos de audio"""
-    update_transcription = pyqtSignal(str)
+    segment_transcribed = pyqtSignal(str)  # solo el texto nuevo de cada fragmento
+    segment_inserted = pyqtSignal(int, str)  # fragmento de relleno: índice en la tienda, texto
     status_update = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
+    queue_stats = pyqtSignal(int, float)  # fragmentos pendientes, retraso en segundos
+    chunk_processed = pyqtSignal(object, str)  # AudioChunk ya aplicado, texto añadido ("" si ninguno)
     
-    def __init__(self, api_key, language_code):
+    def __init__(self, api_key, language_code, max_queue=None, queue_policy=None, max_in_flight=None,
+                 context=None, backend=None, store=None):
         super().__init__()
         self.api_key = api_key
         self.language_code = language_code
+        # Motor de transcripción de la sesión (API de OpenAI o modelo local)
+        self.backend = backend or OpenAIBackend(api_key)
+        # Contexto de la sesión para GPT (TranscriptContext), si se usa
+        self.context = context
         self.running = False
-        self.file_queue = queue.Queue()
-        self.full_transcription = ""
-        self.mutex = QMutex()  # Para proteger acceso a full_transcription
+        # finish(): terminar cuando la cola y las peticiones en curso se vacíen
+        self.draining = False
+        # Peticiones a la API de los hilos del pool, que stop() cancela
+        self.requests = RequestGroup()
+        # Los parámetros no indicados se toman de la configuración
+        settings = get_settings()
+        chunking = settings.chunking
+        if max_queue is None:
+            max_queue = chunking.max_queue
+        if queue_policy is None:
+            queue_policy = chunking.queue_policy
+        if max_in_flight is None:
+            max_in_flight = chunking.max_in_flight
+        if self.backend.max_concurrency is not None:
+            max_in_flight = min(max_in_flight, self.backend.max_concurrency)
+        self.silence_threshold = settings.capture.silence_threshold
+        # Peticiones simultáneas a Whisper; los resultados se reordenan por secuencia
+        self.max_in_flight = max_in_flight
+        # Cola acotada: si Whisper no da abasto se fusionan o descartan fragmentos
+        self.chunk_queue = ChunkQueue(max_queue, queue_policy)
+        # Transcripción de la sesión por segmentos; la interfaz la lee con snapshot()
+        self.store = store if store is not None else SegmentStore(settings.capture.samplerate)
+    
+    def enqueue_chunk(self, chunk):
+        """Añade un fragmento de audio (AudioChunk) a la cola para ser transcrito"""
+        self.chunk_queue.put(chunk)
+        self.emit_queue_stats()
     
-    def enqueue_file(self, filename):
-        """Añade un archivo a la cola para ser transcrito"""
-        self.file_queue.put(filename)
+    def emit_queue_stats(self):
+        """Publica la profundidad de la cola y el retraso acumulado"""
+        self.queue_stats.emit(self.chunk_queue.depth(), self.chunk_queue.lag())
     
     def run(self):
         self.running = True
+        try:
+            # Cargar el modelo (si es local) antes de que llegue el primer fragmento
+            self.status_update.emit(f"Preparando {self.backend.label}...")
+            self.backend.warm_up()
+        except Exception as e:
+            self.running = False
+            self.error_occurred.emit(f"No se pudo preparar el motor de transcripción: {str(e)}")
+            return
         self.status_update.emit("Transcriptor iniciado y esperando archivos de audio")
         
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        in_flight = {}  # future -> (secuencia, fragmento)
+        reorder = ReorderBuffer()
+        next_sequence = 0
+        
         while self.running:
             try:
-                # Intentar obtener un archivo de la cola (con timeout para poder comprobar running)
-                try:
-                    filename = self.file_queue.get(timeout=0.5)
-                except queue.Empty:
-                    continue
-                
-                # Verificar si hay audio real
-                if not recorder.verificar_audio(filename):
-                    self.status_update.emit("Fragmento con poco audio detectado, ignorando")
-                    # Eliminar archivo temporal
+                # Lanzar fragmentos mientras haya hueco en el pool
+                if len(in_flight) < self.max_in_flight:
                     try:
-                        os.remove(filename)
-                    except:
+                        # Con peticiones en curso solo se espera un momento para poder recogerlas
+                        chunk = self.chunk_queue.get(timeout=0.05 if in_flight else 0.5)
+                        QUEUE_WAIT_SECONDS.observe(time.monotonic() - chunk.created_at)
+                        future = executor.submit(self.transcribe_chunk, chunk)
+                        in_flight[future] = (next_sequence, chunk)
+                        next_sequence += 1
+                        self.emit_queue_stats()
+                        self.status_update.emit(
+                            f"Transcribiendo fragmento #{chunk.chunk_id} ({len(in_flight)} en curso)"
+                        )
+                    except queue.Empty:
                         pass
+                
+                if not in_flight:
+                    if self.draining and not self.chunk_queue.depth():
+                        break
                     continue
                 
-                # Transcribir fragmento
-                self.status_update.emit(f"Transcribiendo fragmento: {os.path.basename(filename)}")
+                # Recoger las peticiones terminadas (en cualquier orden)
+                full = len(in_flight) >= self.max_in_flight
+                done, _ = wait(list(in_flight), timeout=0.5 if full else 0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sequence, chunk = in_flight.pop(future)
+                    reorder.add(sequence, (chunk, future))
                 
-                try:
-                    from api_client import WhisperService
-                    transcription = WhisperService.transcribe_file(
-                        self.api_key, filename, self.language_code
-                    )
-                    
-                    if transcription and transcription != "[Error" and len(transcription) > 0:
-                        # Añadir a la transcripción completa (protegido por mutex)
-                        self.mutex.lock()
-                        if self.full_transcription:
-                            self.full_transcription += " " + transcription
-                        else:
-                            self.full_transcription = transcription
-                        current_transcription = self.full_transcription
-                        self.mutex.unlock()
-                        
-                        # Emitir la transcripción completa
-                        self.update_transcription.emit(current_transcription)
-                        self.status_update.emit(f"Transcripción actualizada (+{len(transcription)} caracteres)")
-                    else:
-                        self.status_update.emit("No se detectó texto en el fragmento")
-                    
-                except Exception as e:
-                    self.error_occurred.emit(f"Error al transcribir: {str(e)}")
-                
-                # Eliminar archivo temporal después de procesarlo
-                try:
-                    os.remove(filename)
-                except:
-                    pass
+                # Aplicar los resultados en el orden en que se lanzaron; un
+                # fragmento de relleno se inserta en su posición de captura
+                for chunk, future in reorder.pop_ready():
+                    text = self.apply_result(chunk, future)
+                    self.chunk_processed.emit(chunk, text or "")
                 
             except Exception as e:
                 self.error_occurred.emit(f"Error en el transcriptor: {str(e)}")
                 time.sleep(1)  # Evitar bucle rápido en caso de error
         
+        # Tras finish() ya no queda nada en curso; con stop() se abandona lo pendiente
+        executor.shutdown(wait=False, cancel_futures=True)
+        
+        if isinstance(self.backend, OpenAIBackend):
+            # Informar del coste de codificación frente a los bytes ahorrados
+            print(f"Codificación: {WhisperService.encoder_selector.summary()}")
+            print(f"Peticiones: {ApiEngine.instance(self.api_key).scheduler.summary()}")
+        if self.chunk_queue.merged or self.chunk_queue.dropped:
+            print(f"Cola: {self.chunk_queue.merged} fusiones, {self.chunk_queue.dropped} fragmentos descartados")
         self.status_update.emit("Transcriptor detenido")
     
+    def transcribe_chunk(self, chunk):
+        """Transcribe un fragmento en un hilo del pool. Devuelve None si es silencio"""
+        if peak_level(chunk.audio) < self.silence_threshold:
+            return None
+        with self.requests.active(), TRANSCRIBE_SECONDS.time(backend=self.backend.name):
+            return self.backend.transcribe(chunk.audio, chunk.samplerate, self.language_code)
+    
+    def apply_result(self, chunk, future):
+        """
+        Añade a la transcripción el resultado de un fragmento (ya en orden).
+        Devuelve el texto añadido, o None si el fragmento no aportó texto
+        """
+        try:
+            transcription = future.result()
+        except ApiError as e:
+            if e.retryable:
+                # Límite de peticiones o fallo transitorio: se pierde el fragmento, no la sesión
+                self.status_update.emit(f"Fragmento #{chunk.chunk_id} sin transcribir tras varios reintentos: {e}")
+            else:
+                self.fail(f"Error al transcribir: {str(e)}")
+            return
+        except Exception as e:
+            self.fail(f"Error al transcribir: {str(e)}")
+            return
+        
+        if transcription is None:
+            self.status_update.emit("Fragmento con poco audio detectado, ignorando")
+            return
+        
+        # Si el fragmento se solapa con el segmento que le precede en la
+        # captura, quitar las palabras repetidas. Un fragmento de relleno
+        # ("newest_first") llega después de audio más reciente: se compara
+        # con el texto anterior a su posición, no con el final.
+        previous_end, previous_words = self.store.words_before(chunk.start_frame, 16)
+        if transcription and chunk.start_frame < previous_end:
+            transcription = stitch_transcripts(previous_words, transcription)
+        
+        if transcription:
+            # Añadir a la transcripción completa en su posición de captura
+            index = self.store.append(transcription, chunk.start_frame, chunk.end_frame, chunk.chunk_id)
+            
+            if self.context is not None:
+                self.context.update()
+            
+            if index == len(self.store) - 1:
+                # Solo se emite el texto nuevo: la vista lo añade al final
+                self.segment_transcribed.emit(transcription)
+            else:
+                self.segment_inserted.emit(index, transcription)
+            self.status_update.emit(f"Transcripción actualizada (+{len(transcription)} caracteres)")
+            return transcription
+        self.status_update.emit("No se detectó texto en el fragmento")
+    
+    def fail(self, message):
+        """
+        Error que no se arregla reintentando (API key, cuota...): el resto de
+        fragmentos fallaría igual, así que se detiene el hilo y se informa
+        una sola vez
+        """
+        if not self.running:
+            return
+        self.stop()
+        self.error_occurred.emit(message)
+    
+    def finish(self):
+        """
+        Parada ordenada, una vez detenido el grabador: se transcriben los
+        fragmentos que queden en la cola y en curso, se aplican en orden y
+        el hilo termina solo
+        """
+        self.draining = True
+    
     def stop(self):
-        """Detiene el procesamiento de transcripción"""
+        """
+        Detiene el procesamiento de transcripción sin esperar lo pendiente:
+        cancela también las peticiones en curso, incluidas las que esperan
+        un reintento, para que los hilos del pool terminen enseguida
+        """
         self.running = False
+        self.requests.cancel()
+
+class PendingGptQuery:
+    """
+    Consulta a GPT en streaming cuya respuesta se acumula hasta que haya
+    un diálogo donde mostrarla. Permite lanzar la consulta antes de que el
+    usuario la pida (prefetch) y engancharle el diálogo después.
+    """
+    
+    def __init__(self, api_key, summary, transcription, on_finished=None):
+        self.key = (summary, transcription)
+        self.summary = summary
+        self.transcription = transcription
+        self.parts = []
+        self.result = None  # (éxito, texto) cuando termina
+        self.dialog = None
+        self.on_finished = on_finished
+        self.thread = GptQueryThread(api_key, transcription, stream=True, summary=summary)
+        # Las señales llegan en el hilo de la interfaz, en orden
+        self.thread.delta_received.connect(self._on_delta)
+        self.thread.query_complete.connect(self._on_complete)
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def _on_delta(self, delta):
+        self.parts.append(delta)
+        if self.dialog is not None:
+            self.dialog.append_response(delta)
+    
+    def _on_complete(self, success, result):
+        self.result = (success, result)
+        if self.dialog is not None:
+            self._finish_dialog()
+        if self.on_finished is not None:
+            self.on_finished(self)
+    
+    def _finish_dialog(self):
+        success, result = self.result
+        self.dialog.finish_response(success, result, self.thread.first_token_latency, self.thread.from_cache)
+    
+    def attach(self, dialog):
+        """Muestra en `dialog` lo recibido hasta ahora y lo que llegue después"""
+        self.dialog = dialog
+        if self.parts:
+            dialog.append_response("".join(self.parts))
+        if self.result is not None:
+            self._finish_dialog()
+    
+    def failed(self):
+        return self.result is not None and not self.result[0]
+
 
 class GptResponseDialog(QDialog):
     """Diálogo para mostrar la respuesta de GPT"""
@@ -871,6 +1164,23 @@ class GptResponseDialog(QDialog):
         
         layout.addLayout(button_layout)
     
+    def append_response(self, delta):
+        """Añade un fragmento de la respuesta según llega (streaming)"""
+        # Cursor propio: no mueve la selección ni el scroll del usuario
+        cursor = QTextCursor(self.response_text.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(delta)
+    
+    def finish_response(self, success, result, first_token_latency=None, from_cache=False):
+        """Cierra el streaming: muestra el error o el tiempo hasta el primer token"""
+        if not success:
+            self.response_text.append(f"\n[{result}]")
+            QMessageBox.critical(self, "Error", f"Error al obtener respuesta de GPT: {result}")
+        elif from_cache:
+            self.setWindowTitle("Respuesta de GPT (desde caché)")
+        elif first_token_latency is not None:
+            self.setWindowTitle(f"Respuesta de GPT (primer token en {first_token_latency:.2f} s)")
+    
     def copy_response(self):
         """Copia la respuesta al portapapeles"""
         response = self.response_text.toPlainText()
@@ -908,11 +1218,38 @@ class WhisperApp(QMainWindow):
         self.selected_output_device = None
         self.audio_level_monitor = None
         
+        # Consultas a GPT en curso (PendingGptQuery)
+        self.gpt_queries = []
+        # Contexto resumido de la sesión continua para GPT
+        self.transcript_context = None
+        # Segmentos de la última sesión continua (la vista puede mostrar solo los últimos)
+        self.transcript_store = None
+        
+        # Detección de preguntas y consulta anticipada a GPT
+        self.question_detector = None
+        self.prefetch_query = None
+        self.last_prefetch = 0.0
+        self.question_timer = QTimer(self)
+        self.question_timer.setSingleShot(True)
+        self.question_timer.timeout.connect(self.prefetch_gpt)
+        
         # Hilos para modo continuo
         self.continuous_recorder = None
         self.transcription_worker = None
+        # (grabador, transcriptor) de una sesión detenida que aún termina lo pendiente
+        self.draining_threads = None
         self.is_continuous_mode = False
         
+        # Endpoint opcional de métricas para Prometheus (solo localhost)
+        self.metrics_server = None
+        metrics_settings = get_settings().metrics
+        if metrics_settings.endpoint_enabled:
+            try:
+                self.metrics_server = MetricsServer(metrics_settings.port).start()
+                print(f"Métricas en http://127.0.0.1:{metrics_settings.port}/metrics")
+            except OSError as e:
+                print(f"No se pudo abrir el endpoint de métricas: {e}")
+        
         # Verificar y obtener API key antes de inicializar la UI
         if not self.setup_api_key():
             # Si el usuario cancela el diálogo, cerrar la aplicación
@@ -1046,6 +1383,17 @@ class WhisperApp(QMainWindow):
             
         language_layout.addWidget(language_label)
         language_layout.addWidget(self.language_selector)
+        
+        # Selector del motor de transcripción (por sesión)
+        backend_label = QLabel("Motor:")
+        self.backend_selector = QComboBox()
+        for name, label in available_backends().items():
+            self.backend_selector.addItem(label, name)
+        default_backend = self.backend_selector.findData(get_settings().transcription.backend)
+        if default_backend >= 0:
+            self.backend_selector.setCurrentIndex(default_backend)
+        language_layout.addWidget(backend_label)
+        language_layout.addWidget(self.backend_selector)
         whisper_layout.addLayout(language_layout)
         
         # Botón de transcripción
@@ -1063,7 +1411,8 @@ class WhisperApp(QMainWindow):
         result_group = QGroupBox("Transcripción")
         result_layout = QVBoxLayout(result_group)
         
-        self.transcription_output = QTextEdit()
+        # QPlainTextEdit maqueta por bloques: añadir un segmento no recalcula todo el documento
+        self.transcription_output = QPlainTextEdit()
         self.transcription_output.setReadOnly(True)
         result_layout.addWidget(self.transcription_output)
         
@@ -1088,13 +1437,30 @@ class WhisperApp(QMainWindow):
         result_layout.addLayout(text_button_layout)
         
         bottom_layout.addWidget(result_group)
+        
+        # Panel compacto de métricas por etapa
+        stats_group = QGroupBox("Métricas")
+        stats_layout = QVBoxLayout(stats_group)
+        self.stats_label = QLabel("Sin datos todavía")
+        self.stats_label.setFont(QFont("Consolas", 8))
+        self.stats_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        stats_layout.addWidget(self.stats_label)
+        bottom_layout.addWidget(stats_group)
         splitter.addWidget(bottom_widget)
         
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats_panel)
+        self.stats_timer.start(int(get_settings().metrics.panel_refresh_seconds * 1000))
+        
         # Barra de estado
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage("Listo")
         
+        # Estado de la cola de transcripción (modo continuo)
+        self.queue_label = QLabel("")
+        self.status_bar.addPermanentWidget(self.queue_label)
+        
         # Conectar señales y slots
         self.connect_signals()
     
@@ -1124,11 +1490,15 @@ class WhisperApp(QMainWindow):
     
     def start_continuous_mode(self):
         """Inicia la grabación y transcripción continua"""
-        # Verificar API key
-        if not self.api_key:
+        # Verificar API key (el motor local no la necesita para transcribir)
+        if not self.api_key and self.backend_selector.currentData() == OpenAIBackend.name:
             QMessageBox.warning(self, "Error", "No hay API key configurada")
             return
         
+        backend = self.create_backend()
+        if backend is None:
+            return
+        
         # Obtener dispositivo de audio según el modo seleccionado
         if self.mode_selector.currentIndex() == 0:  # Virtual Cable
             device_idx = recorder.find_device_by_name('cable output')
@@ -1163,6 +1533,7 @@ class WhisperApp(QMainWindow):
         self.audio_setup_button.setEnabled(False)
         self.mode_selector.setEnabled(False)
         self.language_selector.setEnabled(False)
+        self.backend_selector.setEnabled(False)
         self.duration_input.setEnabled(False)
         
         # Cambiar estilo del botón a rojo (detener)
@@ -1175,20 +1546,48 @@ class WhisperApp(QMainWindow):
         
         # Limpiar transcripción anterior
         self.transcription_output.clear()
+        self.transcription_output.setMaximumBlockCount(get_settings().display.max_blocks)
         
         # Crear y configurar el hilo de grabación continua
-        self.continuous_recorder = ContinuousAudioRecorder(device_idx, chunk_duration=3)
-        self.continuous_recorder.update_level.connect(self.update_audio_level)
+        self.continuous_recorder = ContinuousAudioRecorder(device_idx)
+        self.continuous_recorder.meter_ready.connect(self.level_monitor.set_meter)
         self.continuous_recorder.error_occurred.connect(self.handle_continuous_error)
         
+        # Transcripción de la sesión por segmentos, compartida por el transcriptor y el contexto
+        self.transcript_store = SegmentStore(get_settings().capture.samplerate)
+        
+        # Contexto para GPT: lo reciente literal, lo antiguo resumido en segundo plano
+        context_settings = get_settings().context
+        api_key = self.api_key
+        self.transcript_context = TranscriptContext(
+            self.transcript_store,
+            lambda summary, text: GptClient.summarize(api_key, summary, text),
+            context_settings.recent_seconds, context_settings.summary_trigger
+        )
+        
         # Crear y configurar el hilo de transcripción
-        self.transcription_worker = AudioTranscriptionWorker(self.api_key, selected_language)
-        self.transcription_worker.update_transcription.connect(self.update_continuous_transcription)
+        self.transcription_worker = AudioTranscriptionWorker(
+            self.api_key, selected_language, context=self.transcript_context, backend=backend,
+            store=self.transcript_store
+        )
+        self.transcription_worker.segment_transcribed.connect(self.append_continuous_segment)
+        self.transcription_worker.segment_inserted.connect(self.insert_continuous_segment)
         self.transcription_worker.status_update.connect(self.status_bar.showMessage)
         self.transcription_worker.error_occurred.connect(self.handle_continuous_error)
+        self.transcription_worker.queue_stats.connect(self.update_queue_stats)
+        
+        # Detector de preguntas sobre cada segmento nuevo
+        question_settings = get_settings().questions
+        self.question_detector = None
+        self.prefetch_query = None
+        if question_settings.prefetch:
+            self.question_detector = QuestionDetector(
+                question_settings.threshold, question_settings.window_words
+            )
+            self.transcription_worker.segment_transcribed.connect(self.check_for_question)
         
         # Conectar la señal de chunk_ready del grabador al worker de transcripción
-        self.continuous_recorder.chunk_ready.connect(self.transcription_worker.enqueue_file)
+        self.continuous_recorder.chunk_ready.connect(self.transcription_worker.enqueue_chunk)
         
         # Iniciar ambos hilos
         self.transcription_worker.start()
@@ -1198,21 +1597,43 @@ class WhisperApp(QMainWindow):
         self.status_bar.showMessage("Transcripción continua iniciada")
     
     def stop_continuous_mode(self):
-        """Detiene la grabación y transcripción continua"""
-        # Detener hilos en orden correcto
-        if self.continuous_recorder:
-            self.continuous_recorder.stop()
-            self.continuous_recorder = None
-            
-        if self.transcription_worker:
-            self.transcription_worker.stop()
-            self.transcription_worker = None
+        """
+        Detiene la grabación continua. Primero se para el grabador, que envía
+        la última frase del VAD; cuando ha terminado, el transcriptor vacía
+        la cola y las peticiones en curso y termina solo
+        """
+        recorder, worker = self.continuous_recorder, self.transcription_worker
+        self.continuous_recorder = None
+        self.transcription_worker = None
+        
+        if worker is not None:
+            # Conservar las referencias hasta que terminen para que Qt no destruya los hilos
+            self.draining_threads = (recorder, worker)
+            worker.finished.connect(self.continuous_drained)
+            if recorder is not None:
+                # chunk_ready y finished salen del mismo hilo: la última frase se encola antes
+                recorder.finished.connect(worker.finish)
+            if recorder is None or recorder.isFinished():
+                worker.finish()
+            # No se puede empezar otra sesión hasta que se aplique lo pendiente
+            self.continuous_button.setEnabled(False)
+        if recorder is not None:
+            recorder.stop()
+        if worker is not None and worker.isFinished():
+            # Un error fatal ya lo había detenido antes de conectar `finished`
+            self.continuous_drained()
+        
+        # La respuesta anticipada se conserva por si se pide después
+        self.question_timer.stop()
         
         # Restaurar interfaz
+        self.level_monitor.set_meter(None)
+        self.queue_label.setText("")
         self.record_button.setEnabled(True)
         self.audio_setup_button.setEnabled(True)
         self.mode_selector.setEnabled(True)
         self.language_selector.setEnabled(True)
+        self.backend_selector.setEnabled(True)
         self.duration_input.setEnabled(True)
         
         # Restaurar botón a verde (iniciar)
@@ -1224,18 +1645,80 @@ class WhisperApp(QMainWindow):
         )
         
         self.is_continuous_mode = False
+        if self.draining_threads is not None:
+            self.status_bar.showMessage("Terminando de transcribir el audio pendiente...")
+        else:
+            self.status_bar.showMessage("Transcripción continua detenida")
+    
+    def continuous_drained(self):
+        """El transcriptor de la sesión detenida ha aplicado todo lo pendiente"""
+        self.draining_threads = None
+        self.continuous_button.setEnabled(True)
         self.status_bar.showMessage("Transcripción continua detenida")
     
-    def update_continuous_transcription(self, text):
-        """Actualiza el campo de texto con la transcripción continua"""
-        self.transcription_output.setPlainText(text)
-        # Desplazar automáticamente hacia abajo
-        self.transcription_output.moveCursor(self.transcription_output.textCursor().End)
+    def append_continuous_segment(self, segment):
+        """
+        Añade un segmento nuevo al final de la transcripción continua, como
+        bloque propio: el coste no depende de la longitud de la sesión
+        """
+        with UI_APPLY_SECONDS.time():
+            output = self.transcription_output
+            scrollbar = output.verticalScrollBar()
+            # Solo seguir el final si el usuario no se ha desplazado hacia arriba
+            follow = scrollbar.value() >= scrollbar.maximum() - 2
+            cursor = QTextCursor(output.document())
+            cursor.movePosition(QTextCursor.End)
+            if not output.document().isEmpty():
+                cursor.insertBlock()
+            cursor.insertText(segment)
+            if follow:
+                scrollbar.setValue(scrollbar.maximum())
+    
+    def insert_continuous_segment(self, index, segment):
+        """
+        Un fragmento de relleno llega después de texto más reciente: se
+        vuelve a pintar la transcripción desde la tienda para mostrarlo en
+        su posición de captura (es raro, así que no importa que sea O(n))
+        """
+        if self.transcript_store is None:
+            return
+        with UI_APPLY_SECONDS.time():
+            output = self.transcription_output
+            scrollbar = output.verticalScrollBar()
+            follow = scrollbar.value() >= scrollbar.maximum() - 2
+            position = scrollbar.value()
+            view = self.transcript_store.snapshot()
+            max_blocks = output.maximumBlockCount()
+            lo = max(view.lo, view.hi - max_blocks) if max_blocks > 0 else view.lo
+            output.setPlainText("\n".join(view.texts[lo:view.hi]))
+            scrollbar.setValue(scrollbar.maximum() if follow else position)
+    
+    def update_stats_panel(self):
+        """Refresca el panel de métricas con los percentiles recientes de cada etapa"""
+        lines = REGISTRY.summary_lines()
+        if lines:
+            self.stats_label.setText("\n".join(lines))
+    
+    def update_queue_stats(self, depth, lag):
+        """Muestra la profundidad de la cola y el retraso de la transcripción"""
+        self.queue_label.setText(f"Cola: {depth} · retraso {lag:.1f} s")
     
     def handle_continuous_error(self, error_msg):
-        """Maneja errores en la transcripción continua"""
-        QMessageBox.warning(self, "Error", error_msg)
+        """
+        Un error fatal detiene la sesión sin vaciar la cola (lo pendiente
+        fallaría igual). Se desconecta antes de mostrar el aviso para que
+        los errores que lleguen mientras está abierto no abran más diálogos
+        """
+        if not self.is_continuous_mode:
+            # Error tardío de una sesión que ya se había detenido
+            self.status_bar.showMessage(error_msg)
+            return
+        for thread in (self.continuous_recorder, self.transcription_worker):
+            if thread is not None:
+                thread.error_occurred.disconnect(self.handle_continuous_error)
+                thread.stop()
         self.stop_continuous_mode()
+        QMessageBox.warning(self, "Error", error_msg)
     
     def show_audio_setup(self):
         """Muestra el diálogo de configuración de audio"""
@@ -1246,10 +1729,6 @@ class WhisperApp(QMainWindow):
             self.selected_output_device = selected_devices['output']
             self.status_bar.showMessage("Configuración de dispositivos actualizada")
     
-    def update_audio_level(self, level):
-        """Actualiza el widget de nivel de audio"""
-        self.level_monitor.set_level(level)
-    
     def start_recording(self):
         # Desactivar botones durante la grabación
         self.record_button.setEnabled(False)
@@ -1271,7 +1750,7 @@ class WhisperApp(QMainWindow):
             self.selected_input_device
         )
         self.recorder_thread.update_progress.connect(self.update_progress)
-        self.recorder_thread.update_level.connect(self.update_audio_level)
+        self.recorder_thread.meter_ready.connect(self.level_monitor.set_meter)
         self.recorder_thread.recording_complete.connect(self.recording_finished)
         
         # Reiniciar barra de progreso
@@ -1286,6 +1765,7 @@ class WhisperApp(QMainWindow):
     
     def recording_finished(self, success, message):
         # Reactivar botones
+        self.level_monitor.set_meter(None)
         self.record_button.setEnabled(True)
         
         if success:
@@ -1320,17 +1800,29 @@ class WhisperApp(QMainWindow):
             self.api_key = dialog.get_api_key()
             self.status_bar.showMessage("API key actualizada correctamente")
     
+    def create_backend(self):
+        """Crea el motor de transcripción elegido, o None (con aviso) si no se puede"""
+        try:
+            return create_backend(self.backend_selector.currentData(), self.api_key)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"No se pudo crear el motor de transcripción: {e}")
+            return None
+    
     def transcribe_audio(self):
         # Verificar que tenemos audio grabado
         if not self.current_audio_file or not os.path.exists(self.current_audio_file):
             QMessageBox.warning(self, "Error", "No hay archivo de audio para transcribir")
             return
         
-        # Verificar API key (ahora usa la almacenada)
-        if not self.api_key:
+        # Verificar API key (ahora usa la almacenada); el motor local no la necesita
+        if not self.api_key and self.backend_selector.currentData() == OpenAIBackend.name:
             QMessageBox.warning(self, "Error", "No hay API key configurada")
             return
         
+        backend = self.create_backend()
+        if backend is None:
+            return
+        
         # Obtener idioma seleccionado
         selected_language = self.language_selector.currentData()
         
@@ -1340,7 +1832,7 @@ class WhisperApp(QMainWindow):
         
         # Iniciar hilo de transcripción
         self.transcription_thread = TranscriptionThread(
-            self.api_key, self.current_audio_file, selected_language
+            self.api_key, self.current_audio_file, selected_language, backend
         )
         self.transcription_thread.transcription_complete.connect(self.transcription_finished)
         self.transcription_thread.start()
@@ -1350,21 +1842,30 @@ class WhisperApp(QMainWindow):
         self.transcribe_button.setEnabled(True)
         
         if success:
+            # El texto del archivo sustituye a la sesión anterior, también en el contexto de GPT
+            self.transcript_store = None
+            self.transcript_context = None
             self.transcription_output.setPlainText(result)
             self.status_bar.showMessage("Transcripción completada")
         else:
             QMessageBox.critical(self, "Error", f"Error durante la transcripción: {result}")
             self.status_bar.showMessage(f"Error: {result}")
     
+    def transcript_text(self):
+        """Texto completo de la transcripción, aunque la vista no lo muestre entero"""
+        if self.transcript_store is not None:
+            return self.transcript_store.text()
+        return self.transcription_output.toPlainText()
+    
     def copy_text(self):
-        text = self.transcription_output.toPlainText()
+        text = self.transcript_text()
         if text:
             clipboard = QApplication.clipboard()
             clipboard.setText(text)
             self.status_bar.showMessage("Texto copiado al portapapeles")
     
     def save_text(self):
-        text = self.transcription_output.toPlainText()
+        text = self.transcript_text()
         if not text:
             QMessageBox.warning(self, "Advertencia", "No hay texto para guardar")
             return
@@ -1383,6 +1884,10 @@ class WhisperApp(QMainWindow):
     
     def clear_text(self):
         self.transcription_output.clear()
+        if self.transcript_store is not None:
+            self.transcript_store.clear()
+        if self.transcript_context is not None:
+            self.transcript_context.clear()
         self.status_bar.showMessage("Transcripción borrada")
     
     def save_api_key(self):
@@ -1390,11 +1895,25 @@ class WhisperApp(QMainWindow):
         if api_key:
             ApiKeyManager.save_api_key(api_key)
 
+    def gpt_payload(self):
+        """(resumen, transcripción) a enviar a GPT, limitados al presupuesto de tokens"""
+        transcription = self.transcript_text()
+        # En sesiones continuas lo antiguo va resumido
+        budget = get_settings().context.token_budget
+        if self.transcript_context:
+            return self.transcript_context.build(budget)
+        return None, fit_tokens(transcription, budget)
+    
+    def start_gpt_query(self, summary, transcription):
+        """Lanza una consulta a GPT en streaming y mantiene vivo su hilo hasta que termine"""
+        query = PendingGptQuery(self.api_key, summary, transcription, self.handle_gpt_stream_complete)
+        query.thread.finished.connect(lambda: self.gpt_queries.remove(query))
+        self.gpt_queries.append(query)
+        return query.start()
+    
     def send_to_gpt(self):
         """Envía la transcripción actual a GPT y muestra la respuesta"""
-        transcription = self.transcription_output.toPlainText()
-        
-        if not transcription:
+        if not self.transcript_text():
             QMessageBox.warning(self, "Advertencia", "No hay texto para enviar a GPT")
             return
         
@@ -1402,20 +1921,78 @@ class WhisperApp(QMainWindow):
             QMessageBox.warning(self, "Error", "No hay API key configurada")
             return
         
-        # Mostrar diálogo de espera
-        wait_dialog = QMessageBox(self)
-        wait_dialog.setWindowTitle("Procesando")
-        wait_dialog.setText("Enviando texto a GPT. Por favor, espera...")
-        wait_dialog.setStandardButtons(QMessageBox.NoButton)
-        wait_dialog.setIcon(QMessageBox.Information)
-        
-        # Iniciar en un hilo para no bloquear la interfaz
-        self.gpt_thread = GptQueryThread(self.api_key, transcription)
-        self.gpt_thread.query_complete.connect(lambda success, result: self.handle_gpt_response(success, result, wait_dialog, transcription))
+        summary, transcription = self.gpt_payload()
         
-        # Mostrar diálogo y empezar proceso
-        wait_dialog.show()
-        self.gpt_thread.start()
+        # Reutilizar la consulta anticipada si su pregunta sigue siendo la última
+        query = self.prefetch_query
+        self.prefetch_query = None
+        if query is not None and self.prefetch_still_valid(query, summary, transcription):
+            GPT_PREFETCH.inc(outcome="hit")
+            summary, transcription = query.summary, query.transcription
+            self.status_bar.showMessage("Usando la respuesta anticipada de GPT")
+        else:
+            if query is not None:
+                GPT_PREFETCH.inc(outcome="miss")
+            query = self.start_gpt_query(summary, transcription)
+        
+        # Abrir el diálogo de respuesta enseguida; el texto llega en streaming
+        shown = f"[Resumen] {summary}\n\n{transcription}" if summary else transcription
+        dialog = GptResponseDialog(self, shown)
+        dialog.setWindowTitle("Respuesta de GPT (esperando...)")
+        query.attach(dialog)
+        dialog.show()
+    
+    def prefetch_still_valid(self, query, summary, transcription, tail_words=12):
+        """
+        La consulta anticipada sirve aunque hayan llegado segmentos después si
+        la pregunta que respondía (el final de su texto) sigue en la ventana
+        reciente y desde entonces no se ha detectado otra pregunta
+        """
+        if query.failed():
+            return False
+        if query.key == (summary, transcription):
+            return True
+        if self.question_detector is None or self.question_detector.pending():
+            return False
+        question = " ".join(query.transcription.split()[-tail_words:])
+        return bool(question) and question in " ".join(transcription.split())
+    
+    def check_for_question(self, segment):
+        """Con cada segmento nuevo: si parece haber una pregunta, esperar a que haya silencio"""
+        if self.question_detector is None:
+            return
+        if self.question_detector.feed(segment):
+            # Reinicia la cuenta: solo se consulta cuando el texto deja de crecer
+            self.question_timer.start(int(get_settings().questions.debounce_seconds * 1000))
+        else:
+            self.question_timer.stop()
+    
+    def prefetch_gpt(self):
+        """Lanza de forma especulativa la consulta a GPT para la pregunta detectada"""
+        if not self.api_key or not self.is_continuous_mode:
+            return
+        now = time.monotonic()
+        if now - self.last_prefetch < get_settings().questions.min_interval_seconds:
+            return
+        summary, transcription = self.gpt_payload()
+        if not transcription:
+            return
+        if self.prefetch_query is not None and self.prefetch_query.key == (summary, transcription):
+            return
+        self.last_prefetch = now
+        if self.prefetch_query is not None:
+            # La anterior no llegó a usarse
+            GPT_PREFETCH.inc(outcome="unused")
+        self.prefetch_query = self.start_gpt_query(summary, transcription)
+        self.status_bar.showMessage(
+            f"Pregunta detectada (puntuación {self.question_detector.last_score:.1f}): consultando a GPT"
+        )
+        self.question_detector.mark_fired()
+    
+    def handle_gpt_stream_complete(self, query):
+        """Informa del uso de la caché al terminar una consulta"""
+        if GptClient.response_cache is not None and query is not self.prefetch_query:
+            self.status_bar.showMessage(f"Caché de GPT: {GptClient.response_cache.summary()}")
     
     def handle_gpt_response(self, success, result, wait_dialog, transcription):
         """Maneja la respuesta del hilo de GPT"""
@@ -1442,6 +2019,14 @@ class WhisperApp(QMainWindow):
             if hasattr(self, 'transcription_worker') and self.transcription_worker:
                 self.transcription_worker.stop()
             
+            if self.draining_threads is not None:
+                for thread in self.draining_threads:
+                    if thread is not None:
+                        thread.stop()
+            
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+            
             # Ruta a la carpeta de archivos temporales
             temp_dir = os.path.join(os.getcwd(), "temp_audio")
             
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+
+
+class MeterReading:
+    """Medida de nivel por canal de un tramo de audio"""
+
+    def __init__(self, rms, peak, clipped):
+        self.rms = rms
+        self.peak = peak
+        self.clipped = clipped
+
+    @property
+    def level(self):
+        """RMS del canal más fuerte"""
+        return float(self.rms.max()) if len(self.rms) else 0.0
+
+    @property
+    def max_peak(self):
+        return float(self.peak.max()) if len(self.peak) else 0.0
+
+    @property
+    def is_clipping(self):
+        return bool(self.clipped.any())
+
+
+class AudioMeter:
+    """
+    Medidor de niveles que lee directamente del RingBuffer de captura.
+
+    No hay señales por bloque: el consumidor (normalmente un QTimer en el
+    hilo de la interfaz) llama a `measure()` a la frecuencia que quiera y
+    obtiene RMS, pico y clipping por canal de todo el audio llegado desde la
+    lectura anterior, calculados en una sola pasada vectorizada.
+    """
+
+    def __init__(self, buffer, samplerate, max_window=1.0, clip_level=0.999):
+        self.buffer = buffer
+        self.max_window_frames = int(max_window * samplerate)
+        self.clip_level = clip_level
+        self.last_position = buffer.write_pos
+
+    def measure(self):
+        """Devuelve un MeterReading del audio nuevo, o None si no ha llegado nada"""
+        write_pos = self.buffer.write_pos
+        frames = min(write_pos - self.last_position, self.buffer.capacity, self.max_window_frames)
+        self.last_position = write_pos
+        if frames <= 0:
+            return None
+
+        block = self.buffer.view(write_pos - frames, frames)
+        peak = np.abs(block).max(axis=0)
+        rms = np.sqrt(np.einsum('ij,ij->j', block, block) / frames)
+        return MeterReading(rms, peak, peak >= self.clip_level)
+
+
+class PeakHold:
+    """Balística de visualización: caída gradual del nivel y retención del pico"""
+
+    def __init__(self, decay_per_second=1.5, hold_seconds=1.0):
+        self.decay_per_second = decay_per_second
+        self.hold_seconds = hold_seconds
+        self.level = 0.0
+        self.peak = 0.0
+        self.peak_time = 0.0
+        self.last_update = time.monotonic()
+
+    def update(self, level):
+        """Aplica un nuevo nivel (0..1) y devuelve (nivel mostrado, pico retenido)"""
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.last_update = now
+
+        # Subida instantánea, bajada con caída lineal
+        self.level = max(level, self.level - self.decay_per_second * elapsed)
+
+        if level >= self.peak or now - self.peak_time > self.hold_seconds:
+            if level >= self.peak:
+                self.peak_time = now
+            self.peak = max(level, self.peak - self.decay_per_second * elapsed)
+        return self.level, self.peak
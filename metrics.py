@@ -0,0 +1,260 @@
+"""
+Métricas de la canalización: contadores e histogramas por etapa.
+
+Las etapas registran sus mediciones en las métricas de este módulo; la
+aplicación las muestra en un panel compacto y, si se activa en la
+configuración (sección "metrics"), las publica en formato de texto de
+Prometheus en http://127.0.0.1:<puerto>/metrics.
+"""
+import time
+import bisect
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Límites de los buckets en segundos, de milisegundos a medio minuto
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    """Base de las métricas: nombre, descripción y etiquetas declaradas"""
+
+    kind = ""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: se esperaban las etiquetas {self.labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+
+class Counter(Metric):
+    """Valor acumulado que solo crece (eventos, bytes...)"""
+
+    kind = "counter"
+
+    def __init__(self, name, description, labels=(), unit=""):
+        super().__init__(name, description, labels)
+        self.unit = unit
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in sorted(values.items())]
+
+
+class _Series:
+    """Buckets acumulados de un histograma más una muestra reciente para los percentiles"""
+
+    def __init__(self, buckets, window):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = collections.deque(maxlen=window)
+
+
+class Histogram(Metric):
+    """
+    Distribución de duraciones. Los buckets acumulados son los de
+    Prometheus; los percentiles del panel se calculan sobre las últimas
+    `window` observaciones, que reflejan mejor el estado actual.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS, window=256):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _Series(self.buckets, self.window)
+            series.counts[bisect.bisect_left(self.buckets, value)] += 1
+            series.sum += value
+            series.count += 1
+            series.recent.append(value)
+
+    def time(self, **labels):
+        """Context manager que observa la duración del bloque"""
+        return _Timer(self, labels)
+
+    def percentiles(self, quantiles=(0.5, 0.95)):
+        """{etiquetas: (número de observaciones, [percentiles de la muestra reciente])}"""
+        result = {}
+        with self.lock:
+            for key, series in self.series.items():
+                recent = sorted(series.recent)
+                values = [recent[min(len(recent) - 1, int(q * len(recent)))] for q in quantiles]
+                result[key] = (series.count, values)
+        return result
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', le))} {cumulative}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {series.sum}")
+                lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Conjunto de métricas de la aplicación, en el orden en que se registran"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description, labels=(), unit=""):
+        return self._register(Counter(name, description, labels, unit))
+
+    def histogram(self, name, description, labels=(), **options):
+        return self._register(Histogram(name, description, labels, **options))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Todas las métricas en el formato de texto de Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary_lines(self):
+        """Una línea legible por serie con datos, para el panel de la aplicación"""
+        lines = []
+        for metric in self.metrics:
+            if isinstance(metric, Histogram):
+                for key, (count, (p50, p95)) in sorted(metric.percentiles().items()):
+                    suffix = f" [{', '.join(key)}]" if key else ""
+                    lines.append(f"{metric.description}{suffix}: p50 {_format_seconds(p50)} · "
+                                 f"p95 {_format_seconds(p95)} (n={count})")
+            else:
+                total = metric.total()
+                if total:
+                    value = f"{total / 1024:.0f} KB" if metric.unit == "bytes" else f"{total:g}"
+                    lines.append(f"{metric.description}: {value}")
+        return lines
+
+
+def _format_seconds(seconds):
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+
+REGISTRY = MetricsRegistry()
+
+# --- Métricas de cada etapa ---
+
+CAPTURE_XRUNS = REGISTRY.counter(
+    "audio_gpt_capture_xruns_total", "Desbordamientos de captura")
+CHUNK_BUILD_SECONDS = REGISTRY.histogram(
+    "audio_gpt_chunk_build_seconds", "Construcción de fragmentos")
+CHUNK_DELAY_SECONDS = REGISTRY.histogram(
+    "audio_gpt_chunk_delay_seconds", "Retraso al cerrar fragmentos")
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "audio_gpt_queue_wait_seconds", "Espera en la cola")
+ENCODE_SECONDS = REGISTRY.histogram(
+    "audio_gpt_encode_seconds", "Codificación", ("encoder",))
+UPLOAD_BYTES = REGISTRY.counter(
+    "audio_gpt_upload_bytes_total", "Audio subido", unit="bytes")
+API_LATENCY_SECONDS = REGISTRY.histogram(
+    "audio_gpt_api_latency_seconds", "Latencia de la API", ("model",))
+API_REQUESTS = REGISTRY.counter(
+    "audio_gpt_api_requests_total", "Peticiones a la API", ("model", "outcome"))
+TRANSCRIBE_SECONDS = REGISTRY.histogram(
+    "audio_gpt_transcribe_seconds", "Transcripción de fragmentos", ("backend",))
+UI_APPLY_SECONDS = REGISTRY.histogram(
+    "audio_gpt_ui_apply_seconds", "Actualización de la interfaz")
+GPT_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "audio_gpt_gpt_first_token_seconds", "GPT hasta el primer token")
+GPT_PREFETCH = REGISTRY.counter(
+    "audio_gpt_gpt_prefetch_total", "Respuestas anticipadas", ("outcome",))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Publica el registro en /metrics; solo escucha en localhost"""
+
+    daemon_threads = True
+
+    def __init__(self, port=9464, registry=REGISTRY):
+        super().__init__(("127.0.0.1", port), _MetricsHandler)
+        self.registry = registry
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="MetricsServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,98 @@
+import re
+
+
+# Palabras interrogativas al inicio de una frase (español e inglés)
+_INTERROGATIVES = re.compile(
+    r"(?:^|[.!?¿¡]\s*)(qu[eé]|c[oó]mo|cu[aá]l(?:es)?|cu[aá]ndo|d[oó]nde|qui[eé]n(?:es)?|"
+    r"cu[aá]nt[oa]s?|por\s*qu[eé]|para\s*qu[eé]|what|how|why|when|where|which|who|whose|"
+    r"is|are|do|does|did|can|could|would|should|will)\b",
+    re.IGNORECASE | re.UNICODE
+)
+
+# Peticiones directas, típicas de una entrevista técnica
+_REQUESTS = re.compile(
+    r"\b(expl[ií]ca(?:me|nos)?|describ[ea]|d[ií]me|def[ií]ne|implementa|escribe|dise[ñn]a|"
+    r"c[oó]mo\s+(?:har[ií]as|resolver[ií]as|implementar[ií]as)|qu[eé]\s+diferencia|"
+    r"puedes|podr[ií]as|sabr[ií]as|dad[oa]s?|devuelve|encuentra|calcula|"
+    r"explain|describe|tell\s+me|define|implement|write|design|walk\s+me\s+through|"
+    r"given|return|find|compute|can\s+you|could\s+you|how\s+would\s+you|what\s+is\s+the\s+difference)\b",
+    re.IGNORECASE | re.UNICODE
+)
+
+# Vocabulario de problemas de programación y conceptos técnicos
+_CODING_KEYWORDS = re.compile(
+    r"\b(array|arreglo|lista\s+enlazada|linked\s+list|string|cadena|[aá]rbol|tree|grafo|graph|"
+    r"hash(?:\s*map)?|diccionario|dictionary|pila|stack|cola|queue|heap|recursi[oó]n|recursion|"
+    r"algoritmo|algorithm|complejidad|complexity|big\s*o|ordenar|sort(?:ing)?|b[uú]squeda|search|"
+    r"funci[oó]n|function|clase|class|python|sql|query|consulta|join|[ií]ndice|index|"
+    r"regresi[oó]n|regression|overfitting|sobreajuste|modelo|model|p-?valor|p-?value|"
+    r"leetcode|subarray|substring|palindrom[eo]|two\s+sum|fibonacci)\b",
+    re.IGNORECASE | re.UNICODE
+)
+
+_SENTENCES = re.compile(r"[^.!?]+[.!?]*", re.UNICODE)
+
+
+def question_score(text):
+    """
+    Puntuación heurística de lo probable que es que `text` contenga una
+    pregunta a responder. Solo usa expresiones regulares: es lo bastante
+    barata para evaluarse con cada segmento transcrito.
+    """
+    if not text:
+        return 0.0
+    score = 0.0
+    stripped = text.rstrip()
+    if stripped.endswith("?"):
+        score += 2.0
+    elif "?" in text:
+        score += 1.0
+    if "¿" in text:
+        score += 1.0
+    # Una frase que empieza por interrogativo cuenta más que el interrogativo suelto
+    for sentence in _SENTENCES.findall(text):
+        if _INTERROGATIVES.match(sentence.strip()):
+            score += 1.5
+            break
+    if _REQUESTS.search(text):
+        score += 1.5
+    score += min(1.5, 0.5 * len(_CODING_KEYWORDS.findall(text)))
+    return score
+
+
+class QuestionDetector:
+    """
+    Detector local de preguntas sobre el final de la transcripción.
+
+    `feed()` recibe cada segmento nuevo y devuelve True si las últimas
+    `window_words` palabras parecen contener una pregunta. Quien lo usa es
+    responsable del debounce: esperar a que no lleguen segmentos nuevos
+    durante un rato antes de actuar, y de llamar a `mark_fired()` cuando
+    actúe, para que la misma pregunta no vuelva a puntuar mientras siga en
+    la ventana: solo cuenta el texto llegado después.
+    """
+
+    def __init__(self, threshold=2.0, window_words=60):
+        self.threshold = threshold
+        self.window_words = window_words
+        self.words = []
+        self.last_score = 0.0
+
+    def feed(self, segment):
+        self.words.extend(segment.split())
+        del self.words[:-self.window_words]
+        self.last_score = question_score(" ".join(self.words))
+        return self.last_score >= self.threshold
+
+    def mark_fired(self):
+        """La pregunta actual ya se ha atendido: se puntúa solo el texto posterior"""
+        self.words = []
+        self.last_score = 0.0
+
+    def pending(self):
+        """True si el texto llegado desde el último `mark_fired()` parece otra pregunta"""
+        return self.last_score >= self.threshold
+
+    def reset(self):
+        self.words = []
+        self.last_score = 0.0
@@ -206,22 +206,29 @@ def reproducir_audio(filename):
 def verificar_audio(filename):
     try:
         data, _ = sf.read(filename)
-        max_amplitude = np.max(np.abs(data))
+        return verificar_buffer(data)
+    except Exception as e:
+        print(f"Error al verificar el audio: {e}")
+        return False
+
+# Comprueba si hay audio en un buffer en memoria (no solo silencio)
+def verificar_buffer(data, umbral=0.01, verbose=True):
+    max_amplitude = np.max(np.abs(data)) if len(data) else 0.0
+    if verbose:
         print(f"Nivel máximo de audio: {max_amplitude:.6f}")
-        
-        if max_amplitude < 0.01:
-            print("ADVERTENCIA: El archivo parece contener solo silencio o audio muy bajo.")
+    
+    if max_amplitude < umbral:
+        if verbose:
+            print("ADVERTENCIA: El audio parece contener solo silencio o audio muy bajo.")
             print("Asegúrate de que:")
             print("1. El dispositivo 'CABLE Input' está configurado como salida predeterminada en Windows")
             print("2. Estás reproduciendo algún sonido mientras grabas")
             print("3. El volumen del sistema está activado y no está silenciado")
-            return False
-        else:
-            print("El archivo contiene audio (no solo silencio).")
-            return True
-    except Exception as e:
-        print(f"Error al verificar el audio: {e}")
         return False
+    else:
+        if verbose:
+            print("El audio contiene sonido (no solo silencio).")
+        return True
 
 # Método alternativo de grabación usando otro dispositivo
 def record_fallback(filename, duration=5, samplerate=48000):
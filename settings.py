@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import threading
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "gpt_config.json")
+
+
+class SettingsSection:
+    """
+    Grupo de parámetros con valores por defecto tipados.
+
+    Cada subclase declara sus campos en `FIELDS` (nombre -> valor por
+    defecto); al cargar, cada valor se convierte al tipo de su valor por
+    defecto y las claves desconocidas se ignoran con un aviso.
+    """
+
+    FIELDS = {}
+
+    def __init__(self, values=None):
+        values = values or {}
+        for name, default in self.FIELDS.items():
+            setattr(self, name, self._coerce(name, values.get(name, default), default))
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            print(f"Configuración: claves desconocidas en '{self.NAME}': {', '.join(sorted(unknown))}")
+
+    def _coerce(self, name, value, default):
+        if default is None or value is None:
+            return value
+        try:
+            if isinstance(default, bool):
+                if not isinstance(value, bool):
+                    raise ValueError("se esperaba true/false")
+                return value
+            if isinstance(default, float) and isinstance(value, int):
+                return float(value)
+            return type(default)(value)
+        except (TypeError, ValueError) as e:
+            print(f"Configuración: valor no válido para '{self.NAME}.{name}' ({e}), usando {default!r}")
+            return default
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()})"
+
+
+class CaptureSettings(SettingsSection):
+    """Parámetros de captura de audio"""
+    NAME = "capture"
+    FIELDS = {
+        "samplerate": 48000,
+        "channels": 2,
+        "block_seconds": 0.1,          # tamaño del bloque del callback
+        "monitor_samplerate": 44100,   # monitor de niveles del diálogo de configuración
+        "silence_threshold": 0.01,     # pico por debajo del cual un fragmento es silencio
+    }
+
+
+class ChunkingSettings(SettingsSection):
+    """Parámetros de troceado y de la cola de transcripción"""
+    NAME = "chunking"
+    FIELDS = {
+        "use_vad": True,
+        "chunk_duration": 3.0,         # segundos por fragmento sin VAD
+        "record_chunk_duration": 5.0,  # transcripción parcial durante la grabación
+        "overlap": 0.5,
+        "vad_energy_threshold": 0.005,
+        "vad_min_chunk": 1.0,
+        "vad_max_chunk": 12.0,
+        "vad_pause": 0.4,
+        "max_queue": 4,
+        "queue_policy": "merge",
+        "max_in_flight": 3,
+    }
+
+
+class TranscriptionSettings(SettingsSection):
+    """Motor de transcripción y parámetros del modelo local"""
+    NAME = "transcription"
+    FIELDS = {
+        "backend": "openai",           # "openai" o "local"
+        "local_model": "small",
+        "local_device": "cpu",
+        "local_compute_type": "int8",
+        "local_cpu_threads": 0,        # 0: los que decida CTranslate2
+        "local_workers": 1,
+        "local_beam_size": 1,
+    }
+
+
+class EncodingSettings(SettingsSection):
+    """Parámetros de codificación de las subidas a Whisper"""
+    NAME = "encoding"
+    FIELDS = {
+        "mode": "auto",
+        "opus_bitrate": 24000,
+        "upload_bytes_per_second": 250000,
+    }
+
+
+class CacheSettings(SettingsSection):
+    """Parámetros de las cachés persistentes"""
+    NAME = "cache"
+    FIELDS = {
+        "gpt_enabled": True,
+        # Solo se cachean respuestas deterministas: con temperatura > 0 cada
+        # consulta puede dar otra respuesta y reutilizarla la congelaría
+        "gpt_max_temperature": 0.0,
+        "gpt_max_entries": 500,
+        "gpt_max_age_days": 30.0,
+        "transcription_enabled": True,
+        "transcription_max_entries": 2000,
+        "transcription_max_age_days": 90.0,
+    }
+
+
+class ContextSettings(SettingsSection):
+    """Parámetros del contexto enviado a GPT en sesiones largas"""
+    NAME = "context"
+    FIELDS = {
+        "recent_seconds": 120.0,   # texto reciente que se envía literalmente
+        "token_budget": 3000,      # tokens máximos de resumen + transcripción
+        "summary_trigger": 800,    # tokens antiguos sin resumir que disparan un resumen
+        "summary_max_tokens": 400,
+        "summary_prompt": (
+            "Resume de forma concisa la conversación transcrita. Conserva las preguntas "
+            "planteadas, los datos concretos (nombres, cifras, requisitos) y el tema actual. "
+            "Responde solo con el resumen, en el idioma de la conversación."
+        ),
+    }
+
+
+class QuestionSettings(SettingsSection):
+    """Detección local de preguntas y consulta anticipada a GPT"""
+    NAME = "questions"
+    FIELDS = {
+        "prefetch": True,
+        "threshold": 2.0,          # puntuación mínima para considerar que hay una pregunta
+        "window_words": 60,        # palabras finales de la transcripción que se analizan
+        "debounce_seconds": 1.5,   # silencio tras la pregunta antes de consultar
+        "min_interval_seconds": 5.0,
+    }
+
+
+class DisplaySettings(SettingsSection):
+    """Presentación de la transcripción"""
+    NAME = "display"
+    FIELDS = {
+        # Segmentos visibles en modo continuo (0: sin límite); los más antiguos salen de la vista
+        "max_blocks": 0,
+    }
+
+
+class MetricsSettings(SettingsSection):
+    """Métricas de la canalización"""
+    NAME = "metrics"
+    FIELDS = {
+        "endpoint_enabled": False,   # publicar /metrics (formato Prometheus) en localhost
+        "port": 9464,
+        "panel_refresh_seconds": 1.0,
+    }
+
+
+class ModelSettings(SettingsSection):
+    """
+    Parámetros de los modelos. Se leen del nivel superior de
+    gpt_config.json para seguir siendo compatibles con el formato original.
+    """
+    NAME = "model"
+    FIELDS = {
+        "model": "gpt-3.5-turbo",
+        "system_prompt": "Eres un asistente virtual experto que ayuda a los usuarios a comprender y procesar información. Tu tarea es analizar el texto proporcionado (que viene de una transcripción de audio) y ofrecer respuestas claras, útiles y bien estructuradas. Trata de buscar preguntas en la transcripción, y da de la manera más concisa posible la respuesta a esas preguntas. El texto puede incluir carácteres de otros idiomas por fallo de la transcripción, pero ignora texto que no esté en inglés o español.",
+        "temperature": 0.6,
+        "max_tokens": 1000,
+        "top_p": 1.0,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0,
+        "whisper_model": "whisper-1",
+        # URL alternativa de la API (p. ej. fake_openai_server.py); vacía para usar OpenAI
+        "api_base_url": "",
+        # Límites de la cuenta (peticiones y tokens por minuto)
+        "whisper_rpm": 50,
+        "chat_rpm": 500,
+        "chat_tpm": 60000,
+    }
+
+    def chat_params(self):
+        """Parámetros de muestreo para chat.completions.create"""
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "top_p": self.top_p,
+            "frequency_penalty": self.frequency_penalty,
+            "presence_penalty": self.presence_penalty,
+        }
+
+    def rate_limits(self):
+        """Límites por modelo en el formato de RequestScheduler"""
+        return {
+            self.whisper_model: {"rpm": self.whisper_rpm},
+            "default": {"rpm": self.chat_rpm, "tpm": self.chat_tpm},
+        }
+
+
+class Settings:
+    """Instantánea de toda la configuración; una recarga crea otra nueva en lugar de modificarla"""
+
+    SECTIONS = (
+        CaptureSettings, ChunkingSettings, TranscriptionSettings, EncodingSettings,
+        CacheSettings, ContextSettings, QuestionSettings, DisplaySettings, MetricsSettings
+    )
+
+    def __init__(self, data=None):
+        data = dict(data or {})
+        for section in self.SECTIONS:
+            setattr(self, section.NAME, section(data.pop(section.NAME, None)))
+        # El resto de claves (nivel superior) son las del modelo
+        self.model = ModelSettings(data)
+
+    def as_dict(self):
+        data = self.model.as_dict()
+        for section in self.SECTIONS:
+            data[section.NAME] = getattr(self, section.NAME).as_dict()
+        return data
+
+
+class SettingsManager:
+    """
+    Carga la configuración una vez y la recarga si el archivo cambia.
+
+    `get()` devuelve la instantánea en memoria: como mucho una vez cada
+    `check_interval` segundos se consulta el mtime del archivo, y solo si ha
+    cambiado se vuelve a leer. Si el archivo nuevo no es válido se conserva
+    la configuración anterior. Los valores de `set_overrides()` se imponen a
+    los del archivo en cada carga.
+    """
+
+    def __init__(self, path=CONFIG_PATH, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.next_check = 0.0
+        self.settings = Settings()
+        self.version = 0
+        self.overrides = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            # Crear el archivo con la configuración predeterminada
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.settings.as_dict(), f, indent=2, ensure_ascii=False)
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self.mtime:
+                return
+            # Aunque la lectura falle, no volver a leer el mismo archivo roto
+            self.mtime = mtime
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.settings = Settings(merge_settings(data, self.overrides))
+            self.version += 1
+        except Exception as e:
+            print(f"Error al cargar la configuración: {e}")
+
+    def get(self):
+        """Configuración actual"""
+        now = time.monotonic()
+        if now >= self.next_check:
+            with self.lock:
+                if now >= self.next_check:
+                    self.next_check = now + self.check_interval
+                    self._load()
+        return self.settings
+
+    def reload(self):
+        """Fuerza la lectura del archivo"""
+        with self.lock:
+            self.mtime = None
+            self._load()
+        return self.settings
+
+    def set_overrides(self, overrides):
+        """
+        Fija valores que prevalecen sobre los del archivo, con el mismo formato
+        que gpt_config.json (p. ej. {"chunking": {"use_vad": False}}).
+        Los usan las pruebas y el benchmark; no se guardan en disco.
+        """
+        with self.lock:
+            self.overrides = overrides or {}
+            self.mtime = None
+            self._load()
+        return self.settings
+
+
+def merge_settings(data, overrides):
+    """Combina dos configuraciones; las secciones se combinan clave a clave"""
+    merged = dict(data)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = SettingsManager()
+    return _manager
+
+
+def get_settings():
+    """Atajo para obtener la configuración actual"""
+    return get_manager().get()
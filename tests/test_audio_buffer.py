@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from audio_buffer import LinearBuffer, RingBuffer
+
+
+def test_consume_rejects_negative_frames():
+    buffer = RingBuffer(16, 1)
+    buffer.write(np.ones((8, 1), dtype=np.float32))
+    buffer.consume(5)
+    with pytest.raises(ValueError):
+        buffer.consume(-5)
+    assert buffer.read_pos == 5
+
+
+def test_linear_buffer_keeps_the_recording_without_mirroring():
+    buffer = LinearBuffer(10, 1)
+    assert buffer._data.shape == (10, 1)
+    buffer.write(np.arange(6, dtype=np.float32).reshape(-1, 1))
+    assert buffer.write(np.arange(6, 12, dtype=np.float32).reshape(-1, 1)) == 4
+    assert buffer.peek(3).ravel().tolist() == [0, 1, 2]
+    assert buffer.read().ravel().tolist() == list(range(10))
+    assert buffer.latest(2).ravel().tolist() == [8, 9]
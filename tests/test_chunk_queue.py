@@ -0,0 +1,17 @@
+import numpy as np
+
+from audio_processing import AudioChunk
+from chunk_queue import ChunkQueue
+
+
+def make_chunks(count, frames=160):
+    return [AudioChunk(np.zeros((frames, 1), dtype=np.float32), 16000, i * frames) for i in range(count)]
+
+
+def test_newest_first_counts_evicted_backfill_as_dropped():
+    chunks_queue = ChunkQueue(maxsize=2, policy="newest_first", max_backfill=2)
+    for chunk in make_chunks(6):
+        chunks_queue.put(chunk)
+    # 2 en la cola principal, 2 en el relleno y 2 expulsados del relleno
+    assert chunks_queue.depth() == 4
+    assert chunks_queue.dropped == 2
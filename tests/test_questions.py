@@ -0,0 +1,21 @@
+from questions import QuestionDetector
+
+
+def test_fired_question_is_not_scored_again():
+    detector = QuestionDetector(threshold=2.0, window_words=60)
+    assert detector.feed("¿Cómo invertirías una lista enlazada?")
+    assert detector.feed("vale")
+    detector.mark_fired()
+    assert not detector.feed("vale, te escucho")
+    assert detector.feed("¿Y cuál sería la complejidad?")
+
+
+def test_pending_only_looks_at_text_after_the_fired_question():
+    detector = QuestionDetector(threshold=2.0, window_words=60)
+    detector.feed("¿Qué es un heap?")
+    detector.mark_fired()
+    assert not detector.pending()
+    detector.feed("bueno, a ver")
+    assert not detector.pending()
+    detector.feed("¿Y cómo ordenarías un array?")
+    assert detector.pending()
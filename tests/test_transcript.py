@@ -0,0 +1,87 @@
+from concurrent.futures import Future
+
+from transcript import SegmentStore, TranscriptContext, stitch_transcripts
+
+
+def test_removes_overlap_at_the_boundary():
+    previous = "we went to the store and bought the milk"
+    assert stitch_transcripts(previous, "bought the milk was cold") == "was cold"
+
+
+def test_overlap_with_cut_words_at_the_edges():
+    previous = "la reunión empieza a las diez de la mañ"
+    assert stitch_transcripts(previous, "ana de la mañana en punto") == "mañana en punto"
+
+
+def test_keeps_common_phrase_repeated_earlier():
+    previous = "we bought the milk and went back home"
+    assert stitch_transcripts(previous, "the milk was cold") == "the milk was cold"
+
+
+def test_keeps_repeated_in_the_phrase():
+    previous = "the keys were in the drawer next to the door"
+    new = "in the morning we left"
+    assert stitch_transcripts(previous, new) == new
+
+
+def test_keeps_repeated_spanish_phrase():
+    previous = "lo resolvimos de la misma forma que el año pasado"
+    new = "de la misma forma lo haremos ahora"
+    assert stitch_transcripts(previous, new) == new
+
+
+def test_no_overlap_returns_new_unchanged():
+    assert stitch_transcripts("hola a todos", "bienvenidos al curso") == "bienvenidos al curso"
+    assert stitch_transcripts("", "texto nuevo") == "texto nuevo"
+
+
+def test_store_keeps_late_segments_in_capture_order():
+    store = SegmentStore(10)
+    store.append("uno", 0, 10)
+    store.append("tres", 20, 30)
+    before = store.snapshot()
+    assert store.append("dos", 10, 20) == 1
+    assert store.text() == "uno dos tres"
+    assert [segment[3] for segment in store.between(1.5)] == ["dos", "tres"]
+    assert [segment[3] for segment in store.last(1.5)] == ["dos", "tres"]
+    # Las vistas anteriores no cambian
+    assert before.text() == "uno tres"
+
+
+def test_words_before_a_late_segment():
+    store = SegmentStore(10)
+    store.append("uno", 0, 12)
+    store.append("tres", 20, 30)
+    assert store.words_before(10, 16) == (12, "uno")
+    assert store.words_before(30, 16) == (30, "uno tres")
+
+
+def test_context_reads_late_segments_from_the_store():
+    store = SegmentStore(10)
+    context = TranscriptContext(store, lambda summary, text: None, recent_seconds=60, summary_trigger=10 ** 6)
+    store.append("uno", 0, 100)
+    store.append("tres", 200, 300)
+    store.append("dos", 100, 200)
+    context.update()
+    assert context.build(1000) == ("", "uno dos tres")
+
+
+def test_context_summarizes_old_text_outside_the_recent_window():
+    summaries = []
+
+    def summarize(summary, text):
+        summaries.append(text)
+        future = Future()
+        future.set_result(f"resumen de {text}")
+        return future
+
+    store = SegmentStore(10)
+    context = TranscriptContext(store, summarize, recent_seconds=10, summary_trigger=1)
+    store.append("uno", 0, 100)
+    store.append("dos", 100, 200)
+    context.update()
+    assert summaries == ["uno"]
+    store.append("tres", 200, 300)
+    context.update()
+    assert summaries == ["uno", "dos"]
+    assert context.build(1000) == ("resumen de dos", "tres")
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+# gui importa sounddevice, que necesita PortAudio
+pytest.importorskip("sounddevice")
+
+from PyQt5.QtCore import QCoreApplication
+
+from api_client import ApiAuthError, ApiConnectionError, ApiEngine, RequestScheduler
+from audio_processing import AudioChunk
+from backends import TranscriptionBackend
+from gui import AudioTranscriptionWorker
+
+
+class RetryingBackend(TranscriptionBackend):
+    """Motor cuya petición falla siempre con un error reintentable y una espera larga"""
+
+    name = "retrying"
+    label = "Reintentos"
+
+    def __init__(self):
+        self.engine = ApiEngine()
+        self.engine.scheduler = RequestScheduler(base_delay=60.0, max_delay=60.0)
+        self.attempted = threading.Event()
+        self.returned = threading.Event()
+
+    def model_id(self):
+        return "retrying"
+
+    def _transcribe(self, audio, samplerate, language=None, prompt=None):
+        async def request():
+            self.attempted.set()
+            raise ApiConnectionError("Connection error")
+
+        try:
+            return self.engine.run(self.engine.scheduler.execute("whisper-1", request))
+        finally:
+            self.returned.set()
+
+
+def test_stop_returns_promptly_while_a_request_is_retrying():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    backend = RetryingBackend()
+    worker = AudioTranscriptionWorker(None, None, backend=backend)
+    worker.silence_threshold = 0.0
+    worker.enqueue_chunk(AudioChunk(np.ones((1600, 1), dtype=np.float32), 16000))
+    worker.start()
+    assert backend.attempted.wait(5)
+
+    start = time.monotonic()
+    worker.stop()
+    assert worker.wait(2000)
+    # La petición en espera de reintento se cancela en lugar de dormir 30-60 s
+    assert backend.returned.wait(2)
+    assert time.monotonic() - start < 2
+    backend.engine.loop.call_soon_threadsafe(backend.engine.loop.stop)
+
+
+class FailingBackend(TranscriptionBackend):
+    """Motor con la API key rechazada: todos los fragmentos fallan igual"""
+
+    name = "failing"
+    label = "Falla"
+
+    def __init__(self):
+        self.calls = 0
+
+    def model_id(self):
+        return "failing"
+
+    def _transcribe(self, audio, samplerate, language=None, prompt=None):
+        self.calls += 1
+        raise ApiAuthError("Incorrect API key provided", 401)
+
+
+def test_fatal_error_stops_the_worker_and_is_reported_once():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    backend = FailingBackend()
+    worker = AudioTranscriptionWorker(None, None, backend=backend, max_in_flight=2)
+    worker.silence_threshold = 0.0
+    errors = []
+    worker.error_occurred.connect(errors.append)
+    for _ in range(6):
+        worker.enqueue_chunk(AudioChunk(np.ones((1600, 1), dtype=np.float32), 16000))
+    worker.start()
+    assert worker.wait(5000)
+    app.processEvents()
+    assert len(errors) == 1
+    # Los fragmentos que quedaban en la cola no se envían
+    assert backend.calls <= 2
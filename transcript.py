@@ -0,0 +1,344 @@
+import re
+import bisect
+import threading
+from array import array
+
+
+_PUNCTUATION = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def _normalize(token):
+    """Normaliza un token para compararlo: minúsculas y sin puntuación"""
+    return _PUNCTUATION.sub("", token.lower())
+
+
+def stitch_transcripts(previous, new, window=16, min_run=2, max_lead=4, max_trail=1):
+    """
+    Elimina del inicio de `new` el texto repetido del final de `previous`.
+
+    Cuando dos fragmentos consecutivos se solapan, Whisper transcribe dos
+    veces las palabras de la zona común. Se busca la secuencia de tokens
+    común más larga entre los últimos `window` tokens de `previous` y los
+    primeros `window` de `new`, y se devuelve `new` a partir del final de
+    esa secuencia. La secuencia debe terminar como mucho `max_trail` tokens
+    antes del final de `previous` y empezar como mucho `max_lead` tokens
+    después del inicio de `new` (palabras cortadas en el borde): una frase
+    común repetida más atrás no es solape. Si no hay una secuencia de al
+    menos `min_run` tokens se devuelve `new` intacto.
+    """
+    new_tokens = new.split()
+    if not previous or not new_tokens:
+        return new
+
+    tail = [_normalize(token) for token in previous.rsplit(None, window)[-window:]]
+    head = [_normalize(token) for token in new_tokens[:window]]
+
+    # Subcadena común más larga (por tokens) con programación dinámica
+    best_length, best_end = 0, 0
+    lengths = [0] * (len(head) + 1)
+    for i, tail_token in enumerate(tail):
+        # Solo cuentan las secuencias que llegan (casi) al final de `previous`
+        anchored = i >= len(tail) - 1 - max_trail
+        previous_diagonal = 0
+        for j, head_token in enumerate(head, start=1):
+            current = lengths[j]
+            if tail_token and tail_token == head_token:
+                lengths[j] = previous_diagonal + 1
+                if anchored and lengths[j] > best_length and j - lengths[j] <= max_lead:
+                    best_length, best_end = lengths[j], j
+            else:
+                lengths[j] = 0
+            previous_diagonal = current
+
+    if best_length < min_run:
+        return new
+    return " ".join(new_tokens[best_end:])
+
+
+def prompt_tail(text, max_words=150):
+    """
+    Últimas `max_words` palabras de `text`, para usar como `prompt` de Whisper.
+    Whisper solo tiene en cuenta los ~224 tokens finales del prompt.
+    """
+    if not text:
+        return None
+    return " ".join(text.rsplit(None, max_words)[-max_words:])
+
+
+class ReorderBuffer:
+    """
+    Reordena resultados que llegan desordenados (peticiones concurrentes)
+    para entregarlos estrictamente por número de secuencia.
+    """
+
+    def __init__(self, first_sequence=0):
+        self.next_sequence = first_sequence
+        self.pending = {}
+
+    def add(self, sequence, result):
+        self.pending[sequence] = result
+
+    def pop_ready(self):
+        """Devuelve, en orden, los resultados consecutivos ya disponibles"""
+        ready = []
+        while self.next_sequence in self.pending:
+            ready.append(self.pending.pop(self.next_sequence))
+            self.next_sequence += 1
+        return ready
+
+    def __len__(self):
+        return len(self.pending)
+
+
+def count_tokens(text):
+    """Estimación rápida de tokens (~4 caracteres por token)"""
+    return (len(text) + 3) // 4
+
+
+def fit_tokens(text, max_tokens):
+    """Final de `text` que cabe en `max_tokens`, cortado en un límite de palabra"""
+    max_chars = max_tokens * 4
+    if max_chars <= 0:
+        return ""
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    space = tail.find(" ")
+    return tail[space + 1:] if space != -1 else tail
+
+
+class TranscriptContext:
+    """
+    Contexto de una sesión larga para las consultas a GPT, construido sobre
+    la SegmentStore de la sesión.
+
+    Los segmentos de los últimos `recent_seconds` de captura se envían
+    literalmente; cuando el texto más antiguo aún sin resumir supera
+    `summary_trigger` tokens se pide en segundo plano un resumen nuevo que
+    lo incorpora al anterior. `summarize(resumen_previo, texto)` debe
+    devolver un concurrent.futures.Future con el resumen, sin bloquear.
+    Solo guarda el resumen y el frame hasta el que llega: el texto lo lee de
+    la tienda con vistas por tiempo.
+    """
+
+    def __init__(self, store, summarize, recent_seconds=120.0, summary_trigger=800):
+        self.store = store
+        self.summarize = summarize
+        self.recent_seconds = recent_seconds
+        self.summary_trigger = summary_trigger
+        # Reentrante: el Future puede completarse y llamar a _on_summary dentro de update()
+        self.lock = threading.RLock()
+        self.summary = ""
+        # Los segmentos que terminan antes de este frame ya están en el resumen
+        # (uno que llegue tarde por detrás de él no se incorpora)
+        self.summarized_until = 0
+        self.pending = None  # Future del resumen en curso
+
+    def _old(self, view):
+        """Segmentos de `view` anteriores a la ventana literal y aún sin resumir"""
+        recent = view.last(self.recent_seconds)
+        lo = bisect.bisect_right(view.ends, self.summarized_until, view.lo, recent.lo)
+        return SegmentView(self.store, lo, recent.lo, view)
+
+    def update(self):
+        """Con cada segmento nuevo: lanza un resumen si el texto antiguo ha crecido"""
+        with self.lock:
+            if self.pending is not None:
+                return
+            old = self._old(self.store.snapshot())
+            text = old.text()
+            if count_tokens(text) < self.summary_trigger:
+                return
+            until = old.ends[old.hi - 1]
+            try:
+                self.pending = self.summarize(self.summary, text)
+            except Exception as e:
+                print(f"No se pudo lanzar el resumen del contexto: {e}")
+                return
+            self.pending.add_done_callback(lambda future: self._on_summary(future, until))
+
+    def _on_summary(self, future, until):
+        with self.lock:
+            if self.pending is not future:
+                # El contexto se ha borrado mientras se resumía
+                return
+            self.pending = None
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                # Se reintentará con el siguiente segmento
+                print(f"Error al resumir el contexto: {future.exception()}")
+                return
+            self.summary = future.result() or self.summary
+            self.summarized_until = max(self.summarized_until, until)
+
+    def build(self, max_tokens):
+        """
+        Devuelve (resumen, texto) para una consulta, dentro de `max_tokens`.
+        El resumen ocupa como mucho una cuarta parte, el texto reciente el
+        resto y el texto antiguo aún sin resumir el espacio que sobre.
+        """
+        view = self.store.snapshot()
+        with self.lock:
+            recent = view.last(self.recent_seconds).text()
+            old = self._old(view).text()
+            summary = self.summary
+
+        summary = fit_tokens(summary, max_tokens // 4)
+        recent = fit_tokens(recent, max_tokens - count_tokens(summary))
+        remaining = max_tokens - count_tokens(summary) - count_tokens(recent)
+        if old and remaining > 0:
+            recent = f"{fit_tokens(old, remaining)} {recent}".strip()
+        return summary, recent
+
+    def clear(self):
+        """Olvida el resumen; la tienda la vacía quien la comparte"""
+        with self.lock:
+            self.summary = ""
+            self.summarized_until = 0
+            if self.pending is not None:
+                self.pending.cancel()
+                self.pending = None
+
+    def __bool__(self):
+        return bool(len(self.store) or self.summary)
+
+
+class SegmentStore:
+    """
+    Transcripción de una sesión como segmentos con marcas de tiempo.
+
+    Cada segmento guarda sus frames de inicio y fin en la captura, el id del
+    fragmento del que sale y su texto. Los datos numéricos van en arrays
+    compactos y los textos en una lista: añadir es O(1) y buscar por tiempo
+    es O(log n).
+
+    Los segmentos se mantienen ordenados por su frame de inicio y nunca se
+    modifican, así que `snapshot()` y las consultas por tiempo devuelven
+    vistas (SegmentView) que no copian nada y siguen siendo válidas aunque
+    se sigan añadiendo segmentos. Un segmento que llega tarde (un fragmento
+    de relleno) se inserta en su sitio con arrays nuevos, igual que
+    `clear()`, para no alterar las vistas existentes.
+    """
+
+    def __init__(self, samplerate):
+        self.samplerate = samplerate
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Arrays nuevos en lugar de vaciarlos: las vistas existentes no se ven afectadas
+        self.starts = array("q")        # frame de inicio
+        self.ends = array("q")          # frame de fin
+        self.chunk_ids = array("q")
+        self.texts = []
+
+    def append(self, text, start_frame, end_frame, chunk_id=-1):
+        """
+        Añade un segmento en su posición de captura y devuelve su índice.
+        Lo normal es que vaya al final (O(1)); si empieza antes que el
+        último se inserta en orden (O(n)).
+        """
+        with self.lock:
+            if self.starts and start_frame < self.starts[-1]:
+                return self._insert(text, start_frame, end_frame, chunk_id)
+            self.starts.append(start_frame)
+            self.ends.append(end_frame)
+            self.chunk_ids.append(chunk_id)
+            # El texto va lo último: una vista solo ve segmentos completos
+            self.texts.append(text)
+            return len(self.texts) - 1
+
+    def _insert(self, text, start_frame, end_frame, chunk_id):
+        index = bisect.bisect_right(self.starts, start_frame)
+        starts, ends, chunk_ids = self.starts[:index], self.ends[:index], self.chunk_ids[:index]
+        starts.append(start_frame)
+        starts.extend(self.starts[index:])
+        ends.append(end_frame)
+        ends.extend(self.ends[index:])
+        chunk_ids.append(chunk_id)
+        chunk_ids.extend(self.chunk_ids[index:])
+        self.starts, self.ends, self.chunk_ids = starts, ends, chunk_ids
+        self.texts = self.texts[:index] + [text] + self.texts[index:]
+        return index
+
+    def clear(self):
+        with self.lock:
+            self._reset()
+
+    def __len__(self):
+        return len(self.texts)
+
+    def snapshot(self):
+        """Vista de todos los segmentos actuales"""
+        with self.lock:
+            return SegmentView(self, 0, len(self.texts))
+
+    def text(self):
+        return self.snapshot().text()
+
+    def between(self, start_seconds, end_seconds=None):
+        return self.snapshot().between(start_seconds, end_seconds)
+
+    def last(self, seconds):
+        return self.snapshot().last(seconds)
+
+    def words_before(self, frame, count):
+        """
+        (frame de fin, últimas `count` palabras) de los segmentos que
+        empiezan antes de `frame`: el texto con el que puede solaparse un
+        fragmento que empieza en `frame`
+        """
+        view = self.snapshot()
+        index = bisect.bisect_right(view.starts, frame, 0, view.hi)
+        end = view.ends[index - 1] if index else 0
+        words = []
+        while index > 0 and len(words) < count:
+            index -= 1
+            words[:0] = view.texts[index].split()
+        return end, " ".join(words[-count:])
+
+
+class SegmentView:
+    """
+    Rango [lo, hi) de segmentos de un SegmentStore. Conserva referencias a
+    los arrays del momento en que se creó, así que no cambia aunque la
+    tienda crezca o se vacíe.
+    """
+
+    def __init__(self, store, lo, hi, source=None):
+        source = source or store
+        self.store = store
+        self.samplerate = store.samplerate
+        self.starts = source.starts
+        self.ends = source.ends
+        self.chunk_ids = source.chunk_ids
+        self.texts = source.texts
+        self.lo = lo
+        self.hi = max(lo, hi)
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def __iter__(self):
+        """(inicio en s, fin en s, id de fragmento, texto) de cada segmento"""
+        for i in range(self.lo, self.hi):
+            yield (self.starts[i] / self.samplerate, self.ends[i] / self.samplerate,
+                   self.chunk_ids[i], self.texts[i])
+
+    def text(self):
+        return " ".join(self.texts[self.lo:self.hi])
+
+    def between(self, start_seconds, end_seconds=None):
+        """Vista de los segmentos que se solapan con [start_seconds, end_seconds)"""
+        lo = bisect.bisect_right(self.ends, int(start_seconds * self.samplerate), self.lo, self.hi)
+        hi = self.hi
+        if end_seconds is not None:
+            hi = bisect.bisect_left(self.starts, int(end_seconds * self.samplerate), lo, self.hi)
+        return SegmentView(self.store, lo, hi, self)
+
+    def last(self, seconds):
+        """Vista de los segmentos de los últimos `seconds` segundos de captura"""
+        if not self:
+            return self
+        return self.between(self.ends[self.hi - 1] / self.samplerate - seconds)